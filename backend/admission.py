@@ -0,0 +1,152 @@
+"""
+-------------------------------------------------------
+admission.py is per-endpoint-group admission control
+-------------------------------------------------------
+Each group (e.g. "route", "reverse") admits at most CONCURRENCY requests at a
+time. Up to QUEUE more wait in FIFO order for at most QUEUE_TIMEOUT seconds;
+anything beyond that is rejected at once with AdmissionRejected, which main.py
+turns into a 503 with Retry-After. A burst against the upstream-bound
+endpoints is therefore shed in microseconds instead of piling up coroutines
+that each hold a socket for a 15-60 s upstream timeout, and cheap endpoints
+keep their latency.
+
+Limits come from the environment, per group:
+    ADMISSION_<GROUP>_CONCURRENCY    ADMISSION_<GROUP>_QUEUE    ADMISSION_<GROUP>_QUEUE_TIMEOUT
+-------------------------------------------------------
+"""
+import asyncio
+import collections
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from backend import metrics
+
+admission_rejections_total = metrics.Counter(
+    "admission_rejections_total", "Requests shed by admission control.", ("group", "reason")
+)
+admission_queue_wait_seconds = metrics.Histogram(
+    "admission_queue_wait_seconds", "Time admitted requests spent queued.", ("group",),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, group: str, reason: str, retry_after: int):
+        super().__init__(f"{group} is saturated ({reason})")
+        self.group = group
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_limit = max(0, queue)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        # Moving average of how long an admitted request holds its slot, for Retry-After
+        self._avg_hold = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain, given the recent hold time
+        drain = (self.queued + 1) * self._avg_hold / self.concurrency
+        return max(1, min(60, math.ceil(drain)))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        admission_rejections_total.inc(self.name, reason)
+        return AdmissionRejected(self.name, reason, self.retry_after())
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            admission_queue_wait_seconds.observe(0.0, self.name)
+            return
+        if len(self._waiters) >= self.queue_limit:
+            raise self._reject("queue_full")
+
+        start = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter, so in_flight is already counted
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            raise self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        admission_queue_wait_seconds.observe(time.perf_counter() - start, self.name)
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # The slot was handed over just as we gave up; pass it on
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, held_for: Optional[float] = None) -> None:
+        if held_for is not None:
+            self._avg_hold += 0.2 * (held_for - self._avg_hold)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+
+def _gate_from_env(name: str, concurrency: int, queue: int, queue_timeout: float) -> AdmissionGate:
+    prefix = f"ADMISSION_{name.upper()}_"
+    return AdmissionGate(
+        name,
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        queue=int(os.getenv(prefix + "QUEUE", str(queue))),
+        queue_timeout=float(os.getenv(prefix + "QUEUE_TIMEOUT", str(queue_timeout))),
+    )
+
+
+GATES: Dict[str, AdmissionGate] = {
+    gate.name: gate for gate in (
+        _gate_from_env("route", concurrency=32, queue=64, queue_timeout=5.0),
+        _gate_from_env("reverse", concurrency=16, queue=32, queue_timeout=3.0),
+    )
+}
+
+
+def gate(name: str) -> AdmissionGate:
+    return GATES[name]
+
+
+def _collect_admission_metrics():
+    for g in GATES.values():
+        labels = {"group": g.name}
+        yield "admission_in_flight", "gauge", "Requests holding an admission slot.", labels, g.in_flight
+        yield "admission_queued", "gauge", "Requests waiting for an admission slot.", labels, g.queued
+        yield "admission_concurrency_limit", "gauge", "Configured concurrent slots.", labels, g.concurrency
+        yield "admission_queue_limit", "gauge", "Configured wait queue length.", labels, g.queue_limit
+
+
+metrics.register_collector(_collect_admission_metrics)
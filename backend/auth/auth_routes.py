@@ -9,12 +9,13 @@ API Endpoints:
 - POST /auth/logout - Logout current user
 - GET /auth/verify - Verify current session
 - GET /auth/me - Get current user info
+- PATCH /auth/me - Change the current user's display name
 """
-from fastapi import APIRouter, HTTPException, Request, status
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from pydantic import BaseModel, EmailStr, Field, ConfigDict
 from typing import Optional, List, Dict
 
-from backend.auth import auth_storage
+from backend.auth import auth_storage, session_tokens, throttle
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -51,6 +52,19 @@ class LoginRequest(BaseModel):
     password: str = Field(..., description="User's password")
 
 
+class UpdateNameRequest(BaseModel):
+    """Data sent by the frontend when a user changes their display name."""
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "name": "Jane Doe"
+            }
+        }
+    )
+    
+    name: str = Field(..., min_length=1, max_length=100, description="New display name")
+
+
 class AuthResponse(BaseModel):
     """Data returned to the frontend after successful login or signup."""
     model_config = ConfigDict(
@@ -83,6 +97,29 @@ class MessageResponse(BaseModel):
     message: str = Field(..., description="Response message")
 
 
+def _reject_if_throttled(retry_after: Optional[int]) -> None:
+    """
+    Raises 429 before any password hashing happens if a limiter tripped.
+    """
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts. Please try again later.",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+def _start_session(request: Request, response: Response, user: Dict) -> None:
+    """
+    In token mode the signed claim cookie replaces the server-side session;
+    otherwise the user id goes into the SessionMiddleware cookie as before.
+    """
+    if session_tokens.enabled():
+        session_tokens.set_claim_cookie(response, user)
+    else:
+        request.session["user_id"] = user["id"]
+
+
 @router.post(
     "/signup",
     response_model=AuthResponse,
@@ -90,10 +127,11 @@ class MessageResponse(BaseModel):
     summary="Register a new user",
     description="Create a new user account with a Laurier email address and establish a session"
 )
-async def signup(body: SignupRequest, request: Request):
-    user = auth_storage.create_user(body.name, body.email, body.password)
-    
-    if user is None:
+async def signup(body: SignupRequest, request: Request, response: Response):
+    _reject_if_throttled(throttle.check_signup(request))
+    try:
+        user = await auth_storage.create_user_async(body.name, body.email, body.password)
+    except ValueError as e:
         if not body.email.lower().endswith("@mylaurier.ca"):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -109,10 +147,10 @@ async def signup(body: SignupRequest, request: Request):
         else:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Password must be at least 8 characters long."
+                detail=str(e)
             )
 
-    request.session["user_id"] = user["id"]
+    _start_session(request, response, user)
     
     return AuthResponse(
         user_id=user["id"],
@@ -129,16 +167,18 @@ async def signup(body: SignupRequest, request: Request):
     summary="Login an existing user",
     description="Authenticate a user and establish a session"
 )
-async def login(body: LoginRequest, request: Request):
+async def login(body: LoginRequest, request: Request, response: Response):
+    _reject_if_throttled(throttle.check_login(request, body.email))
     user = auth_storage.get_user_by_email(body.email)
     
-    if user is None or not auth_storage.verify_user_password(user, body.password):
+    if user is None or not await auth_storage.verify_user_password_async(user, body.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password."
         )
     
-    request.session["user_id"] = user["id"]
+    _start_session(request, response, user)
+    auth_storage.cache_display_name(user["id"], user["name"])
     
     return AuthResponse(
         user_id=user["id"],
@@ -155,8 +195,10 @@ async def login(body: LoginRequest, request: Request):
     summary="Logout user",
     description="Clear the current session"
 )
-async def logout(request: Request):
+async def logout(request: Request, response: Response):
     request.session.clear()
+    if session_tokens.enabled():
+        session_tokens.clear_claim_cookie(request, response)
     return MessageResponse(message="Successfully logged out. Session cleared.")
 
 
@@ -168,6 +210,16 @@ async def logout(request: Request):
     description="Check if user has a valid session and get user information"
 )
 async def verify_session(request: Request):
+    # Fast path: a valid signed claim answers without touching storage
+    claim = session_tokens.get_request_claim(request)
+    if claim:
+        return UserResponse(
+            user_id=claim["user_id"],
+            name=claim["name"],
+            email=claim["email"],
+            authenticated=True
+        )
+    
     user_id = request.session.get("user_id")
     
     if not user_id:
@@ -204,9 +256,47 @@ async def get_current_user(request: Request):
     return await verify_session(request)
 
 
+@router.patch(
+    "/me",
+    response_model=UserResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Change display name",
+    description="Rename the currently logged-in user; rooms and messages they wrote show the new name"
+)
+async def update_current_user(body: UpdateNameRequest, request: Request, response: Response):
+    user_id = get_session_user_id(request)
+    try:
+        user = auth_storage.update_user_name(user_id, body.name)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found. Please login."
+        )
+    
+    if session_tokens.enabled():
+        # The claim carries the display name, so swap it for one with the new name
+        token = request.cookies.get(session_tokens.CLAIM_COOKIE_NAME)
+        if token:
+            session_tokens.revoke_claim(token)
+        session_tokens.set_claim_cookie(response, user)
+    
+    return UserResponse(
+        user_id=user["id"],
+        name=user["name"],
+        email=user["email"],
+        authenticated=True
+    )
+
+
 
 def get_session_user_id(request: Request) -> str:
-    user_id = request.session.get("user_id")
+    user_id = session_tokens.get_session_user_id_optional(request)
     if not user_id:
         raise HTTPException(
             status_code=401,
@@ -216,23 +306,22 @@ def get_session_user_id(request: Request) -> str:
 
 
 def get_session_user_id_optional(request: Request) -> Optional[str]:
-    return request.session.get("user_id")
+    return session_tokens.get_session_user_id_optional(request)
 
 
 user_router = APIRouter(prefix="/api/users", tags=["users"])
 
 @user_router.get("/{user_id}")
-def get_user(user_id: str):
+async def get_user(user_id: str):
     user = auth_storage.get_user_by_id(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"user_id": user["id"], "name": user["name"], "email": user["email"]}
 
 @user_router.post("/batch")
-def batch_users(ids: List[str]):
+async def batch_users(ids: List[str]):
     out: Dict[str, Optional[Dict]] = {}
-    for uid in ids:
-        u = auth_storage.get_user_by_id(uid)
+    for uid, u in auth_storage.get_users_by_ids(ids).items():
         if u:
             out[uid] = {"user_id": u["id"], "name": u["name"], "email": u["email"]}
         else:
@@ -6,13 +6,15 @@ Manages user accounts and password verification using in-memory storage.
 
 import os
 import uuid
+import asyncio
 import hashlib
 import secrets
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional, Dict, Iterable, Mapping, Callable, List
 import logging
-from sqlalchemy import create_engine, Column, String, DateTime, func
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from backend import journal
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +23,50 @@ connect_args = {}
 if DATABASE_URL.startswith("sqlite"):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
-Base = declarative_base()
+# The SQLAlchemy engine is built on first use: importing sqlalchemy and creating
+# the engine is a large share of cold-start time, and the user store is in memory.
+@lru_cache(maxsize=None)
+def get_engine():
+    from sqlalchemy import create_engine
+    return create_engine(DATABASE_URL, connect_args=connect_args, future=True)
+
+@lru_cache(maxsize=None)
+def get_session_factory():
+    from sqlalchemy.orm import sessionmaker
+    return sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
+
+@lru_cache(maxsize=None)
+def get_declarative_base():
+    from sqlalchemy.orm import declarative_base
+    return declarative_base()
+
+def __getattr__(name: str):
+    # Keeps auth_storage.engine / SessionLocal / Base working, built on first access
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_session_factory()
+    if name == "Base":
+        return get_declarative_base()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Configuration
 ALLOWED_EMAIL_DOMAIN = "@mylaurier.ca"
 
+# Password hashing configuration
+# PASSWORD_HASH_SCHEME is either "scrypt" or "pbkdf2_sha256". Cost parameters are
+# read once at import; hashes made with older parameters are upgraded at login.
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "scrypt")
+SCRYPT_N = int(os.getenv("SCRYPT_N", "16384"))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", "600000"))
+
+# Hashing runs on a bounded worker pool so signup/login never stall the event loop.
+# hashlib's scrypt and pbkdf2_hmac release the GIL, so threads scale across cores.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+_HASH_EXECUTOR = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+
 # In-memory storage structures
 # Stores user accounts indexed by user_id
 USERS_BY_ID: Dict[str, dict] = {}
@@ -35,40 +74,90 @@ USERS_BY_ID: Dict[str, dict] = {}
 # Email-to-user_id mapping for quick lookups
 USERS_BY_EMAIL: Dict[str, str] = {}
 
+# Read-only public views (id, name, email) shared by every lookup of a user
+PUBLIC_USER_VIEWS: Dict[str, Mapping] = {}
+
+# Display-name cache used to stamp names onto rooms and messages at write time.
+# Filled on signup/login (and lazily on a miss), invalidated when a name changes.
+DISPLAY_NAMES: Dict[str, str] = {}
+
+# Callbacks run as callback(user_id, new_name) after a user's name changes, so
+# records that carry a stamped copy of the name can be refreshed.
+_NAME_CHANGE_LISTENERS: List[Callable[[str, str], None]] = []
+
 
 # Private Helper Functions
 
-def _hash_password(password: str) -> str:
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # OpenSSL rejects scrypt calls that need more than maxmem bytes (default 32 MiB)
+    maxmem = 128 * n * r * (p + 1) + 1024 * 1024
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=32)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def _hash_password(password: str, scheme: Optional[str] = None) -> str:
     """
-    Creates a salted hash of the password using SHA-256.
+    Creates a salted hash of the password using the configured KDF.
     
     Args:
         password: Plain text password
+        scheme: "scrypt" or "pbkdf2_sha256" (defaults to PASSWORD_HASH_SCHEME)
         
     Returns:
-        String in format "salt:hash"
+        String in format "scrypt$n$r$p$salt$hash" or "pbkdf2_sha256$iterations$salt$hash"
     """
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.sha256((password + salt).encode("utf-8")).hexdigest()
-    return f"{salt}:{password_hash}"
+    scheme = scheme or PASSWORD_HASH_SCHEME
+    salt = secrets.token_bytes(16)
+    if scheme == "scrypt":
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    if scheme == "pbkdf2_sha256":
+        digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+    raise ValueError(f"Unknown password hash scheme: {scheme}")
 
 
 def _verify_password_hash(stored_hash: str, password: str) -> bool:
     """
     Verifies a password against a stored hash.
+    Accepts scrypt, PBKDF2 and legacy "salt:sha256" hashes.
     Uses constant-time comparison to prevent timing attacks.
         
     Returns:
         True if password matches, False otherwise
     """
     try:
-        salt, password_hash = stored_hash.split(":", 1)
-        computed_hash = hashlib.sha256((password + salt).encode("utf-8")).hexdigest()
-        return secrets.compare_digest(computed_hash, password_hash)
+        if stored_hash.startswith("scrypt$"):
+            _, n, r, p, salt, password_hash = stored_hash.split("$")
+            computed = _scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p)).hex()
+        elif stored_hash.startswith("pbkdf2_sha256$"):
+            _, iterations, salt, password_hash = stored_hash.split("$")
+            computed = _pbkdf2(password, bytes.fromhex(salt), int(iterations)).hex()
+        else:
+            salt, password_hash = stored_hash.split(":", 1)
+            computed = hashlib.sha256((password + salt).encode("utf-8")).hexdigest()
+        return secrets.compare_digest(computed, password_hash)
     except ValueError:
         return False
 
 
+def _needs_rehash(stored_hash: str) -> bool:
+    """
+    Returns True if the stored hash was not made with the current scheme and cost.
+    """
+    if PASSWORD_HASH_SCHEME == "scrypt":
+        return not stored_hash.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored_hash.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+async def _run_in_hash_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_HASH_EXECUTOR, fn, *args)
+
+
 def _normalize_email(email: str) -> str:
     """
     Normalizes email to lowercase and strips whitespace.
@@ -89,19 +178,30 @@ def _is_laurier_email(email: str) -> bool:
     return email.endswith(ALLOWED_EMAIL_DOMAIN)
 
 
-# Public API Functions
+def _refresh_public_view(user: Dict) -> Mapping:
+    view = MappingProxyType({
+        "id": user["id"],
+        "name": user["name"],
+        "email": user["email"]
+    })
+    PUBLIC_USER_VIEWS[user["id"]] = view
+    return view
+
+
+def _notify_name_change(user_id: str, name: str) -> None:
+    for callback in list(_NAME_CHANGE_LISTENERS):
+        try:
+            callback(user_id, name)
+        except Exception:
+            logger.exception("Display name listener failed for user %s", user_id)
 
-def create_user(name: str, email: str, password: str) -> Optional[Dict]:
+
+def _validate_new_user(name: str, email: str, password: str) -> str:
     """
-    Creates a new user account if the email is valid and not already taken.
+    Checks signup input before any hashing work is done.
     
-    Args:
-        name: User's full name
-        email: User's email address (must be @mylaurier.ca)
-        password: User's password (must be at least 8 characters)
-        
     Returns:
-        User dict with 'id', 'name', 'email' if successful, None otherwise
+        Normalized email address
     """
     email = _normalize_email(email)
     
@@ -109,19 +209,29 @@ def create_user(name: str, email: str, password: str) -> Optional[Dict]:
         raise ValueError("Email must be a @mylaurier.ca address.")
     if email in USERS_BY_EMAIL:
         raise ValueError("Email already registered.")
-    if not name or not password or len(password) < 8:
+    if not name or not name.strip() or not password or len(password) < 8:
         raise ValueError("Name required and password must be at least 8 characters.")
+    return email
+
+
+def _store_user(name: str, email: str, password_hash: str) -> Dict:
+    # Re-checked here because async signups hash outside the event loop
+    if email in USERS_BY_EMAIL:
+        raise ValueError("Email already registered.")
     
     user_id = str(uuid.uuid4())
     user = {
         "id": user_id,
         "name": name.strip(),
         "email": email,
-        "password_hash": _hash_password(password),
+        "password_hash": password_hash,
     }
     
     USERS_BY_ID[user_id] = user
     USERS_BY_EMAIL[email] = user_id
+    _refresh_public_view(user)
+    cache_display_name(user_id, user["name"])
+    journal.record("user.put", dict(user))
     
     return {
         "id": user["id"],
@@ -130,6 +240,43 @@ def create_user(name: str, email: str, password: str) -> Optional[Dict]:
     }
 
 
+# Public API Functions
+
+def create_user(name: str, email: str, password: str) -> Dict:
+    """
+    Creates a new user account if the email is valid and not already taken.
+    Hashes inline; async callers should use create_user_async instead.
+    
+    Args:
+        name: User's full name
+        email: User's email address (must be @mylaurier.ca)
+        password: User's password (must be at least 8 characters)
+        
+    Returns:
+        User dict with 'id', 'name', 'email'
+    
+    Raises:
+        ValueError: wrong email domain, email already registered, or name/password too short
+    """
+    email = _validate_new_user(name, email, password)
+    return _store_user(name, email, _hash_password(password))
+
+
+async def create_user_async(name: str, email: str, password: str) -> Dict:
+    """
+    Same as create_user, but the password is hashed on the hashing worker pool.
+    
+    Returns:
+        User dict with 'id', 'name', 'email'
+    
+    Raises:
+        ValueError: same cases as create_user
+    """
+    email = _validate_new_user(name, email, password)
+    password_hash = await _run_in_hash_pool(_hash_password, password)
+    return _store_user(name, email, password_hash)
+
+
 def get_user_by_email(email: str) -> Optional[Dict]:
     """
     Returns a user dict given an email, or None if not found.
@@ -155,15 +302,98 @@ def get_user_by_id(user_id: str) -> Optional[Dict]:
     Returns:
         User dict without password_hash if found, None otherwise
     """
+    view = PUBLIC_USER_VIEWS.get(user_id)
+    if view is None:
+        return None
+    
+    return dict(view)
+
+
+def get_users_by_ids(user_ids: Iterable[str]) -> Dict[str, Optional[Mapping]]:
+    """
+    Resolves many users in one call. Duplicate ids are looked up once.
+    The returned views are shared and read-only; copy one with dict(view)
+    before changing it. A database-backed store should implement this as a
+    single "WHERE id IN (...)" query per batch.
+    
+    Args:
+        user_ids: Iterable of user ID strings
+        
+    Returns:
+        Dict mapping each requested id to its public view, or None if not found
+    """
+    views = PUBLIC_USER_VIEWS
+    return {uid: views.get(uid) for uid in dict.fromkeys(user_ids)}
+
+
+def cache_display_name(user_id: str, name: str) -> None:
+    """
+    Records a user's display name in the cache (called on signup and login).
+    """
+    if user_id and name:
+        DISPLAY_NAMES[user_id] = name
+
+
+def get_display_name(user_id: str) -> Optional[str]:
+    """
+    Returns the cached display name for a user, filling the cache on a miss.
+        
+    Returns:
+        Display name if the user exists, None otherwise
+    """
+    name = DISPLAY_NAMES.get(user_id)
+    if name is None:
+        view = PUBLIC_USER_VIEWS.get(user_id)
+        if view is None:
+            return None
+        name = view["name"]
+        DISPLAY_NAMES[user_id] = name
+    return name
+
+
+def on_display_name_change(callback: Callable[[str, str], None]) -> None:
+    """
+    Registers callback(user_id, new_name) to run after a user's name changes.
+    """
+    _NAME_CHANGE_LISTENERS.append(callback)
+
+
+def update_user_name(user_id: str, name: str) -> Optional[Dict]:
+    """
+    Changes a user's display name, invalidates the cached name and notifies
+    listeners so stamped copies (room creator_name, message user_name) are refreshed.
+    
+    Returns:
+        Updated user dict without password_hash, or None if the user does not exist
+    """
     user = USERS_BY_ID.get(user_id)
     if not user:
         return None
+    name = name.strip()
+    if not name:
+        raise ValueError("Name required.")
     
-    return {
-        "id": user["id"],
-        "name": user["name"],
-        "email": user["email"]
-    }
+    user["name"] = name
+    _refresh_public_view(user)
+    DISPLAY_NAMES.pop(user_id, None)
+    journal.record("user.put", dict(user))
+    _notify_name_change(user_id, name)
+    
+    return get_user_by_id(user_id)
+
+
+def load_user(user: Dict) -> None:
+    """
+    Restores a user record from a snapshot or journal replay.
+    A replayed rename is propagated to listeners just like a live one.
+    """
+    previous = USERS_BY_ID.get(user["id"])
+    USERS_BY_ID[user["id"]] = user
+    USERS_BY_EMAIL[user["email"]] = user["id"]
+    _refresh_public_view(user)
+    DISPLAY_NAMES.pop(user["id"], None)
+    if previous and previous["name"] != user["name"]:
+        _notify_name_change(user["id"], user["name"])
 
 
 def verify_user_password(user: Dict, password: str) -> bool:
@@ -179,6 +409,30 @@ def verify_user_password(user: Dict, password: str) -> bool:
     return _verify_password_hash(user["password_hash"], password)
 
 
+async def verify_user_password_async(user: Dict, password: str) -> bool:
+    """
+    Verifies the password on the hashing worker pool.
+    On success, hashes made with an old scheme or cost are transparently
+    replaced with one made using the current settings.
+      
+    Returns:
+        True if password matches, False otherwise
+    """
+    if not user or "password_hash" not in user:
+        return False
+    stored_hash = user["password_hash"]
+    if not await _run_in_hash_pool(_verify_password_hash, stored_hash, password):
+        return False
+    if _needs_rehash(stored_hash):
+        new_hash = await _run_in_hash_pool(_hash_password, password)
+        # Skip if the hash changed underneath us (e.g. a concurrent login already upgraded it)
+        if user.get("password_hash") == stored_hash:
+            user["password_hash"] = new_hash
+            journal.record("user.put", dict(user))
+            logger.info("Upgraded password hash for user %s", user.get("id"))
+    return True
+
+
 def get_all_users_count() -> int:
     """
     Returns the total number of registered users.
@@ -0,0 +1,191 @@
+# session_tokens.py
+"""
+Session Tokens Module
+Optional stateless session mode. Instead of looking the user up in storage on
+every authenticated call, login issues a compact, signed, expiring claim
+(user id, name, email) in its own cookie. Verifying it is one HMAC with a key
+derived once at startup; logout adds the token id to an in-memory revocation list.
+
+Enable with SESSION_MODE=token. The default ("cookie") keeps the existing
+SessionMiddleware-only behaviour.
+"""
+
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import secrets
+from functools import lru_cache
+from typing import Optional, Dict
+
+from fastapi import Request, Response
+
+from backend import journal
+
+# Configuration
+SESSION_MODE = os.getenv("SESSION_MODE", "cookie")
+CLAIM_COOKIE_NAME = "wb_claim"
+CLAIM_TTL_SECONDS = int(os.getenv("SESSION_CLAIM_TTL", "86400"))
+
+# Revoked token ids mapped to the claim's expiry; entries are dropped once the
+# claim would have expired anyway, so the set only holds live logouts. Journaled
+# and snapshotted like the other stores, so a logout survives a warm restart.
+_REVOKED: Dict[str, int] = {}
+
+
+# Private Helper Functions
+
+@lru_cache(maxsize=1)
+def _signing_key() -> bytes:
+    secret = os.getenv("SESSION_SECRET", "placeholder-session-secret")
+    return hashlib.sha256(b"walkingbuddy-claim:" + secret.encode("utf-8")).digest()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_signing_key(), payload.encode("ascii"), hashlib.sha256).digest()[:16])
+
+
+def _prune_revoked(now: int) -> None:
+    expired = [jti for jti, exp in _REVOKED.items() if exp <= now]
+    for jti in expired:
+        del _REVOKED[jti]
+
+
+# Public API Functions
+
+def enabled() -> bool:
+    """
+    Returns True if the stateless claim mode is turned on.
+    """
+    return SESSION_MODE == "token"
+
+
+def issue_claim(user_id: str, name: str, email: str) -> str:
+    """
+    Creates a signed claim token for a user.
+    
+    Returns:
+        Token string in format "payload.signature"
+    """
+    exp = int(time.time()) + CLAIM_TTL_SECONDS
+    body = json.dumps([user_id, name, email, exp, secrets.token_hex(8)], separators=(",", ":"))
+    payload = _b64encode(body.encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def read_claim(token: str) -> Optional[Dict]:
+    """
+    Checks a claim token's signature, expiry and revocation status.
+        
+    Returns:
+        Dict with 'user_id', 'name', 'email', 'exp', 'jti' if valid, None otherwise
+    """
+    try:
+        payload, signature = token.split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        user_id, name, email, exp, jti = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if exp <= time.time() or jti in _REVOKED:
+        return None
+    return {"user_id": user_id, "name": name, "email": email, "exp": exp, "jti": jti}
+
+
+def revoke_claim(token: str) -> bool:
+    """
+    Adds a claim to the revocation list (used on logout).
+    
+    Returns:
+        True if a valid claim was revoked, False otherwise
+    """
+    claim = read_claim(token)
+    if not claim:
+        return False
+    now = int(time.time())
+    _prune_revoked(now)
+    _REVOKED[claim["jti"]] = claim["exp"]
+    journal.record("session.revoke", claim["jti"], claim["exp"])
+    return True
+
+
+def revoked_claims() -> Dict[str, int]:
+    """
+    Returns the live revocations (jti -> expiry) for a snapshot.
+    """
+    _prune_revoked(int(time.time()))
+    return dict(_REVOKED)
+
+
+def load_revocation(jti: str, exp: int) -> None:
+    """
+    Restores a revocation from a snapshot or journal replay; expired ones are skipped.
+    """
+    if exp > time.time():
+        _REVOKED[jti] = exp
+
+
+def get_request_claim(request: Request) -> Optional[Dict]:
+    """
+    Returns the verified claim carried by a request, or None.
+    The result is memoized on request.state so a handler can ask repeatedly.
+    """
+    if not enabled():
+        return None
+    cached = getattr(request.state, "session_claim", False)
+    if cached is not False:
+        return cached
+    token = request.cookies.get(CLAIM_COOKIE_NAME)
+    claim = read_claim(token) if token else None
+    request.state.session_claim = claim
+    return claim
+
+
+def set_claim_cookie(response: Response, user: Dict) -> None:
+    """
+    Issues a claim for the user and attaches it to the response as a cookie.
+    """
+    token = issue_claim(user["id"], user["name"], user["email"])
+    response.set_cookie(
+        CLAIM_COOKIE_NAME,
+        token,
+        max_age=CLAIM_TTL_SECONDS,
+        httponly=True,
+        secure=True,
+        samesite="none",
+    )
+
+
+def clear_claim_cookie(request: Request, response: Response) -> None:
+    """
+    Revokes the request's claim (if any) and deletes the cookie.
+    """
+    token = request.cookies.get(CLAIM_COOKIE_NAME)
+    if token:
+        revoke_claim(token)
+    response.delete_cookie(CLAIM_COOKIE_NAME, httponly=True, secure=True, samesite="none")
+
+
+def get_session_user_id_optional(request: Request) -> Optional[str]:
+    """
+    Resolves the caller's user id from the claim cookie, falling back to the
+    SessionMiddleware session. Never touches user storage.
+    """
+    claim = get_request_claim(request)
+    if claim:
+        return claim["user_id"]
+    try:
+        return request.session.get("user_id")
+    except AssertionError:
+        # SessionMiddleware not installed (e.g. a bare test app)
+        return None
@@ -0,0 +1,156 @@
+# throttle.py
+"""
+Throttle Module
+Sliding-window rate limiters for the signup and login endpoints.
+
+Each key (client IP or email) holds a small ring of per-bucket counters that
+together cover the window, so memory per key is fixed no matter how many
+attempts it makes. Keys are kept in least-recently-used order and expired from
+the front as their last bucket falls out of the window, which keeps cleanup
+O(1) amortized even with a very large number of distinct keys.
+"""
+
+import ipaddress
+import os
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Request
+
+# Configuration
+THROTTLE_WINDOW_SECONDS = float(os.getenv("THROTTLE_WINDOW_SECONDS", "60"))
+LOGIN_LIMIT_PER_IP = int(os.getenv("LOGIN_LIMIT_PER_IP", "20"))
+LOGIN_LIMIT_PER_EMAIL = int(os.getenv("LOGIN_LIMIT_PER_EMAIL", "10"))
+SIGNUP_LIMIT_PER_IP = int(os.getenv("SIGNUP_LIMIT_PER_IP", "10"))
+# Behind a proxy (e.g. Render's) every request comes from the proxy address, so
+# set this to take the client IP from the last X-Forwarded-For hop (the one the
+# proxy added). Off by default: without a proxy in front, a client could pick
+# its own "IP" per request and walk around the per-IP limits.
+THROTTLE_TRUST_FORWARDED = os.getenv("THROTTLE_TRUST_FORWARDED", "0") == "1"
+# Optional comma-separated proxy addresses/networks; when set, X-Forwarded-For
+# is only honoured on requests that arrive from one of them
+THROTTLE_TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(p.strip(), strict=False)
+    for p in os.getenv("THROTTLE_TRUSTED_PROXIES", "").split(",") if p.strip()
+)
+
+
+class SlidingWindowLimiter:
+    """
+    Approximate sliding-window counter: the window is split into `buckets`
+    time slices and a request is allowed while the sum over the live slices
+    is below `limit`.
+    """
+
+    def __init__(self, limit: int, window_seconds: float, buckets: int = 6, max_keys: int = 100_000):
+        self.limit = limit
+        self.window = window_seconds
+        self.buckets = buckets
+        self.bucket_width = window_seconds / buckets
+        self.max_keys = max_keys
+        # key -> [last_bucket_index, counts ring of length `buckets`]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expire(self, now_idx: int) -> None:
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry[0] > now_idx - self.buckets and len(entries) <= self.max_keys:
+                break
+            entries.popitem(last=False)
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Records an attempt for `key` unless it is over the limit.
+        
+        Returns:
+            (allowed, retry_after_seconds); retry_after is 0 when allowed
+        """
+        now = time.monotonic() if now is None else now
+        now_idx = int(now // self.bucket_width)
+        entries = self._entries
+
+        entry = entries.get(key)
+        if entry is None:
+            entry = [now_idx, [0] * self.buckets]
+            entries[key] = entry
+        else:
+            entries.move_to_end(key)
+            counts = entry[1]
+            # Zero the slices that have rotated out since this key was last seen
+            stale = min(now_idx - entry[0], self.buckets)
+            for i in range(1, stale + 1):
+                counts[(entry[0] + i) % self.buckets] = 0
+            entry[0] = now_idx
+        self._expire(now_idx)
+
+        counts = entry[1]
+        if sum(counts) >= self.limit:
+            # Wait until the oldest non-empty slice leaves the window
+            for age in range(self.buckets - 1, -1, -1):
+                if counts[(now_idx - age) % self.buckets]:
+                    break
+            retry_after = (now_idx - age + self.buckets) * self.bucket_width - now
+            return False, max(retry_after, 0.0)
+
+        counts[now_idx % self.buckets] += 1
+        return True, 0.0
+
+    def reset(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+login_ip_limiter = SlidingWindowLimiter(LOGIN_LIMIT_PER_IP, THROTTLE_WINDOW_SECONDS)
+login_email_limiter = SlidingWindowLimiter(LOGIN_LIMIT_PER_EMAIL, THROTTLE_WINDOW_SECONDS)
+signup_ip_limiter = SlidingWindowLimiter(SIGNUP_LIMIT_PER_IP, THROTTLE_WINDOW_SECONDS)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Returns the best guess at the caller's IP address.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if THROTTLE_TRUST_FORWARDED and _from_trusted_proxy(peer):
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return peer
+
+
+def _from_trusted_proxy(peer: str) -> bool:
+    if not THROTTLE_TRUSTED_PROXIES:
+        return True
+    try:
+        address = ipaddress.ip_address(peer)
+    except ValueError:
+        return False
+    return any(address in network for network in THROTTLE_TRUSTED_PROXIES)
+
+
+def check_login(request: Request, email: str) -> Optional[int]:
+    """
+    Applies the per-IP and per-email login limits.
+    
+    Returns:
+        None if allowed, otherwise the Retry-After value in whole seconds
+    """
+    allowed, retry_after = login_ip_limiter.hit(client_ip(request))
+    if allowed:
+        allowed, retry_after = login_email_limiter.hit(email.lower().strip())
+    return None if allowed else max(1, math.ceil(retry_after))
+
+
+def check_signup(request: Request) -> Optional[int]:
+    """
+    Applies the per-IP signup limit.
+    
+    Returns:
+        None if allowed, otherwise the Retry-After value in whole seconds
+    """
+    allowed, retry_after = signup_ip_limiter.hit(client_ip(request))
+    return None if allowed else max(1, math.ceil(retry_after))
@@ -0,0 +1,133 @@
+"""
+-------------------------------------------------------
+compression.py is the response compression middleware (brotli/gzip)
+-------------------------------------------------------
+Bodies under COMPRESSION_MIN_SIZE bytes, streamed bodies and responses that
+already carry a Content-Encoding are passed through untouched. brotli is used
+when the optional `brotli` package is installed and the client accepts it;
+otherwise gzip.
+
+Handlers that serve a cached, pre-encoded body (room list, route results) call
+mark_cacheable(request, key) with whatever already identifies that body (the
+route cache key, the room generation). The compressed bytes are kept in a TTL
+cache under that key, next to a reference to the body they were made from; a
+hit only counts while the response carries that same body object, so a
+rebuilt body is recompressed without hashing or copying any bytes. Cacheable
+bodies are compressed once, at a higher level since the cost is amortized.
+
+Compression never runs long on the event loop: cacheable bodies and anything
+over COMPRESSION_OFFLOAD_SIZE are compressed on a worker thread; small
+per-request bodies use a fast level inline.
+-------------------------------------------------------
+"""
+import gzip
+import os
+from typing import Hashable
+
+from starlette.concurrency import run_in_threadpool
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+
+from backend.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSED_CACHE_SIZE = int(os.getenv("COMPRESSED_CACHE_SIZE", "128"))
+# Bodies at least this big are compressed on a worker thread even when not cacheable
+COMPRESSION_OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "65536"))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/geo+json")
+
+# (encoding, cache key) -> (body the bytes were made from, compressed bytes)
+compressed_cache = TTLCache(maxsize=COMPRESSED_CACHE_SIZE, ttl=600)
+
+
+def mark_cacheable(request: Request, key: Hashable) -> None:
+    """
+    Lets the middleware reuse compressed bytes for this response's body.
+    `key` identifies the body's content (e.g. a route cache key or a room generation).
+    """
+    request.state.compress_cache_key = key
+
+
+def _pick_encoding(accept_encoding: str):
+    accepted = {part.split(";", 1)[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str, cacheable: bool) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=9 if cacheable else 4)
+    return gzip.compress(body, compresslevel=9 if cacheable else 6)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _pick_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            content_type = headers.get("content-type", "")
+            if (
+                message.get("more_body")
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            key = scope.get("state", {}).get("compress_cache_key")
+            cacheable = key is not None
+            compressed = None
+            if cacheable:
+                entry = compressed_cache.get((encoding, key))
+                # Same key but a rebuilt body (e.g. the route was planned again) means recompress
+                if entry is not None and entry[0] is body:
+                    compressed = entry[1]
+            if compressed is None:
+                if cacheable or len(body) >= COMPRESSION_OFFLOAD_SIZE:
+                    compressed = await run_in_threadpool(_compress, body, encoding, cacheable)
+                else:
+                    compressed = _compress(body, encoding, cacheable)
+                if cacheable:
+                    compressed_cache.set((encoding, key), (body, compressed))
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,123 @@
+"""
+-------------------------------------------------------
+idempotency.py makes retried POSTs safe with an Idempotency-Key header
+-------------------------------------------------------
+A client that may retry a request (flaky mobile network, chat.js re-sending
+after an automatic join) sends the same Idempotency-Key on every attempt. The
+first attempt runs the handler and its JSON response is kept for
+IDEMPOTENCY_TTL_SECONDS; any later attempt with that key gets the stored bytes
+back with "Idempotent-Replayed: true" and nothing is written or broadcast
+again. An attempt that arrives while the first is still running waits for it
+and shares its outcome.
+
+Keys are scoped per endpoint and caller, and bound to a fingerprint of the
+request body: reusing a key for a different body is a 422. Only successful
+responses are stored; a failed attempt can be retried with the same key.
+Requests without the header behave exactly as before.
+-------------------------------------------------------
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import HTTPException, Request
+
+from backend import metrics
+from backend.auth import session_tokens
+from backend.cache import TTLCache
+from backend.serialization import PreEncodedJSONResponse, dumps
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+
+# (scope, caller, key) -> (request fingerprint, encoded response)
+RESULTS = TTLCache(maxsize=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")), ttl=IDEMPOTENCY_TTL_SECONDS)
+metrics.register_cache("idempotency", RESULTS)
+
+# (scope, caller, key) -> (request fingerprint, task running the first attempt)
+_in_flight: Dict[Hashable, tuple] = {}
+
+idempotent_replays_total = metrics.Counter(
+    "idempotent_replays_total", "Requests answered from an earlier attempt with the same Idempotency-Key.",
+    ("scope", "source"),
+)
+
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.blake2b(dumps(payload), digest_size=16).hexdigest()
+
+
+def _replay(scope: str, source: str, body: bytes) -> PreEncodedJSONResponse:
+    idempotent_replays_total.inc(scope, source)
+    return PreEncodedJSONResponse(body, headers={"Idempotent-Replayed": "true"})
+
+
+async def run(
+    request: Request,
+    scope: str,
+    payload: Any,
+    handler: Callable[[], Awaitable[Any]],
+    user_id: Optional[str] = None,
+):
+    """
+    Runs handler() at most once per Idempotency-Key.
+
+    Args:
+        scope: endpoint name, e.g. "rooms.create"
+        payload: the request body; a replay must carry the same one
+        handler: does the work and returns the JSON-able response
+        user_id: the caller when there is no session (the body's user_id)
+
+    Returns:
+        handler()'s result when there is no key, else a pre-encoded response
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return await handler()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{HEADER} must be at most {MAX_KEY_LENGTH} characters")
+
+    # Keys belong to the caller, so two users can't collide on (or replay) each other's keys
+    try:
+        caller = session_tokens.get_session_user_id_optional(request) or user_id
+    except Exception:
+        caller = user_id
+    cache_key = (scope, caller, key)
+    request_print = fingerprint(payload)
+
+    def check(stored_print: str) -> None:
+        if stored_print != request_print:
+            idempotent_replays_total.inc(scope, "mismatch")
+            raise HTTPException(status_code=422, detail=f"{HEADER} was already used for a different request")
+
+    stored = RESULTS.get(cache_key)
+    if stored is not None:
+        check(stored[0])
+        return _replay(scope, "cache", stored[1])
+
+    running = _in_flight.get(cache_key)
+    if running is not None:
+        check(running[0])
+        # The first attempt's error (e.g. a 404) is this attempt's error too
+        body = await asyncio.shield(running[1])
+        return _replay(scope, "in_flight", body)
+
+    async def first_attempt() -> bytes:
+        body = dumps(await handler())
+        RESULTS.set(cache_key, (request_print, body))
+        return body
+
+    # A task, so a client that disconnects mid-request doesn't cancel the work for its retry
+    task = asyncio.ensure_future(first_attempt())
+    _in_flight[cache_key] = (request_print, task)
+
+    def finished(t: asyncio.Task) -> None:
+        _in_flight.pop(cache_key, None)
+        if not t.cancelled():
+            t.exception()  # retrieved here in case no attempt is left to await it
+
+    task.add_done_callback(finished)
+    return PreEncodedJSONResponse(await asyncio.shield(task))
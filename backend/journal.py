@@ -0,0 +1,158 @@
+"""
+-------------------------------------------------------
+journal.py is the append-only mutation journal for the in-memory stores
+-------------------------------------------------------
+Storage modules call record(op, *args) after every mutation. Records are
+length-prefixed pickles appended to the currently open segment file; when no
+segment is open (persistence disabled, or while replaying) record() is a no-op.
+Every op is written so that replaying it twice is harmless, because a mutation
+can land both in a snapshot and in the segment opened just before it.
+
+The stores call record() on the event loop, so it only pickles the record and
+queues it; one writer thread does the file I/O, writing whatever has queued up
+in a single write + flush. Segment switches go through the same queue, so every
+record lands in the segment that was open when it was recorded.
+
+That makes journaling asynchronous: a response can go out before its record
+reaches the file, and a crash loses whatever was still queued (normally a few
+milliseconds' worth). A failed write is logged and counted in
+journal_errors_total rather than failing the request that made the mutation.
+-------------------------------------------------------
+"""
+import collections
+import logging
+import pickle
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+from backend import metrics
+
+logger = logging.getLogger("uvicorn.error")
+
+_HEADER = struct.Struct("<I")
+
+# Encoded records and segment switches, in order. deque append/popleft are thread-safe
+_queue: collections.deque = collections.deque()
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+# Guards _drain_queued, so at most one drain is waiting in the writer at a time
+_LOCK = threading.Lock()
+_drain_queued = False
+# True between open_segment() and close_segment(), as seen by callers
+_open = False
+# Only touched by the writer thread
+_segment = None
+
+journal_errors_total = metrics.Counter(
+    "journal_errors_total", "Journal segment I/O failures; records in a failed write are lost.", ("op",),
+)
+
+
+class _Switch:
+    __slots__ = ("path",)
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+
+def _drain() -> None:
+    """Writer thread: writes queued records, applying segment switches in order."""
+    global _drain_queued, _segment
+    with _LOCK:
+        _drain_queued = False
+    chunks = []
+    while _queue:
+        item = _queue.popleft()
+        if not isinstance(item, _Switch):
+            chunks.append(item)
+            continue
+        _write(chunks)
+        chunks = []
+        old, _segment = _segment, None
+        if old is not None:
+            try:
+                old.close()
+            except OSError:
+                journal_errors_total.inc("close")
+                logger.exception("Could not close journal segment %s", old.name)
+        if item.path is not None:
+            try:
+                _segment = open(item.path, "ab")
+            except OSError:
+                journal_errors_total.inc("open")
+                logger.exception("Could not open journal segment %s; mutations are not journaled", item.path)
+    _write(chunks)
+
+
+def _write(chunks) -> None:
+    # Nothing surfaces errors from here (the drain's future is not awaited), so log and count them
+    if chunks and _segment is not None:
+        try:
+            _segment.write(b"".join(chunks))
+            _segment.flush()
+        except OSError:
+            journal_errors_total.inc("write")
+            logger.exception("Journal write to %s failed; %d records may be lost", _segment.name, len(chunks))
+
+
+def _enqueue(item) -> None:
+    global _drain_queued
+    _queue.append(item)
+    with _LOCK:
+        if _drain_queued:
+            return
+        _drain_queued = True
+    _WRITER.submit(_drain)
+
+
+def record(op: str, *args) -> None:
+    if not _open:
+        return
+    data = pickle.dumps((op, time.time()) + args, protocol=pickle.HIGHEST_PROTOCOL)
+    _enqueue(_HEADER.pack(len(data)) + data)
+
+
+def open_segment(path: str) -> None:
+    """Starts a new segment at `path`; records from here on go to it."""
+    global _open
+    _open = True
+    _enqueue(_Switch(path))
+
+
+def close_segment() -> Future:
+    """
+    Stops journaling. Returns a future that completes once everything recorded
+    so far is on disk (wrap it with asyncio.wrap_future to await it).
+    """
+    global _open
+    _open = False
+    _enqueue(_Switch(None))
+    # Queued after any pending drain, so it completes once the writer has caught up
+    return _WRITER.submit(lambda: None)
+
+
+def read_segment(path: str) -> Iterator[Tuple]:
+    """
+    Yields (op, timestamp, *args) records from a segment file. A torn record
+    at the end (crash mid-write) ends the iteration instead of raising.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    end = len(data)
+    while offset + _HEADER.size <= end:
+        (size,) = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        if offset + size > end:
+            break
+        try:
+            yield pickle.loads(data[offset:offset + size])
+        except Exception:
+            break
+        offset += size
+
+
+def is_open() -> bool:
+    return _open
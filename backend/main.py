@@ -7,15 +7,17 @@ __updated__ = "2025-12-05"
 """
 # Imports
 import os 
-import uvicorn
-import httpx
 import asyncio
+import hashlib
+import importlib
 import re
-from fastapi import FastAPI, Request
+import time
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import logging
-from fastapi.responses import PlainTextResponse # pinger
+from fastapi.responses import PlainTextResponse, JSONResponse # pinger
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -26,9 +28,15 @@ from backend.auth import auth_routes
 # Sinthujan 
 from backend.walkingbuddy import room_routes, chat_routes
 
+from backend import persistence, metrics, tracing, profiling, admission
+from backend.cache import TTLCache
+from backend.navigation import nav_logic
+from backend.compression import CompressionMiddleware, compressed_cache, mark_cacheable
+from backend.serialization import FastJSONResponse, PreEncodedJSONResponse, dumps
+
 logger.info("CORS allow_origins = %s", ["https://KeithOruwari19.github.io", "https://cp317-group-18-project.onrender.com"])
 # fastapi
-app = FastAPI(title="WalkingBuddy Navigation + Rooms") 
+app = FastAPI(title="WalkingBuddy Navigation + Rooms", default_response_class=FastJSONResponse) 
 app.add_middleware(
     CORSMiddleware,
     # I know we had the code below as a placeholder but now we should have frontend to initialize this
@@ -42,6 +50,18 @@ app.add_middleware(
 SESSION_SECRET = os.getenv("SESSION_SECRET", "placeholder-session-secret") # placeholder so that website doesn't crash
 app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET, same_site="none", https_only=True)
 
+# gzip/brotli for route geometry, reverse-geocode blobs and long chat pages; small bodies skip it
+app.add_middleware(CompressionMiddleware)
+
+# X-Profile: <PROFILE_ADMIN_TOKEN> profiles the hot handlers for this request
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Outermost, so latency includes every other middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
+# X-Trace-Id / Server-Timing on every response; wraps metrics so the root span is the whole request
+app.add_middleware(tracing.TracingMiddleware)
+
  # Connecting all the modules via router
 app.include_router(auth_routes.router)
 app.include_router(room_routes.router)
@@ -51,32 +71,186 @@ app.include_router(auth_routes.user_router)
 
 USER_AGENT = "WalkingBuddy/1.0"
 CONTACT_EMAIL = "dang1532@mylaurier.ca"
+# Upstream base URLs; overridable so benchmarks can point at a local stand-in (benchmarks/fake_upstream.py)
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org").rstrip("/")
+PHOTON_URL = os.getenv("PHOTON_URL", "https://photon.komoot.io").rstrip("/")
+OSRM_PROJECT_URL = os.getenv("OSRM_PROJECT_URL", "https://router.project-osrm.org").rstrip("/")
+OSRM_FOSSGIS_URL = os.getenv("OSRM_FOSSGIS_URL", "https://routing.openstreetmap.de").rstrip("/")
 _COORD_RE = re.compile(r'^\s*([-+]?\d*\.?\d+)\s*[, ]\s*([-+]?\d*\.?\d+)\s*$')
 
+# Successful route responses, stored already JSON-encoded
+ROUTE_CACHE = TTLCache(
+    maxsize=int(os.getenv("ROUTE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ROUTE_CACHE_TTL_SECONDS", "600")),
+)
+metrics.register_cache("route", ROUTE_CACHE)
+
+# Route handle -> {"start_coord", "dest_coord", "mode", "route"}, so steps and progress can be
+# served later without re-geocoding (progress also stores its nav_logic.RouteTrack as "track"). Larger than ROUTE_CACHE so a handle outlives the body that carries it
+ROUTE_HANDLES = TTLCache(maxsize=ROUTE_CACHE.maxsize * 4, ttl=ROUTE_CACHE.ttl)
+metrics.register_cache("route_handle", ROUTE_HANDLES)
+# Step fetches in progress, per handle, so concurrent requests share one upstream call
+_steps_in_flight = {}
+metrics.register_cache("compressed", compressed_cache)
+
+# Optional bearer token for /metrics; leave unset to allow any scraper
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# One pooled client for every upstream call, created on first use so connections
+# and TLS sessions stay warm between requests; each call passes its own timeout
+# httpx is imported here rather than at module level; it is a noticeable slice of cold start
+_http_client = None
+
+def get_http_client() -> "httpx.AsyncClient":
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=15.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+        )
+    return _http_client
+
+async def _upstream_get(upstream: str, url: str, attempt: int = 1, **kwargs) -> "httpx.Response":
+    """
+    Shared-client get() that records latency per upstream in upstream_request_duration_seconds
+    and as a trace span named after the upstream.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    with tracing.span(upstream, attempt=attempt) as span:
+        try:
+            r = await get_http_client().get(url, **kwargs)
+            outcome = f"{r.status_code // 100}xx"
+            if span is not None:
+                span["attrs"]["status"] = r.status_code
+            return r
+        finally:
+            metrics.upstream_request_duration_seconds.observe(time.perf_counter() - start, upstream, outcome)
+
+async def _backoff(seconds: float) -> None:
+    with tracing.span("backoff", seconds=seconds):
+        await asyncio.sleep(seconds)
+
+@app.exception_handler(admission.AdmissionRejected)
+async def _admission_rejected(request: Request, exc: admission.AdmissionRejected):
+    return JSONResponse(
+        {"success": False, "error": "Server busy, please retry shortly"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.on_event("startup")
 async def _log_routes():
+    tracing.install_log_filter()
     logger.info("Registered routes: %s", [r.path for r in app.routes])
 
+# Restore must run before the sweeper starts so restored rooms get scheduled
+@app.on_event("startup")
+async def _restore_state():
+    persistence.restore()
+    if persistence.enabled():
+        app.state.snapshotter = asyncio.create_task(persistence.run_periodic())
+
+@app.on_event("shutdown")
+async def _snapshot_state():
+    task = getattr(app.state, "snapshotter", None)
+    if task:
+        task.cancel()
+    if persistence.enabled():
+        await persistence.shutdown()
+
+# Runs once the server is accepting requests: imports httpx off the event loop, opens
+# the shared client and builds the search indexes and /list body for restored rooms
+@app.on_event("startup")
+async def _start_warming():
+    app.state.warming = asyncio.create_task(_warm())
+
+async def _warm():
+    started = time.perf_counter()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, "httpx")
+        get_http_client()
+        await room_routes.warm_caches()
+        logger.info("Background warming finished in %.1f ms", (time.perf_counter() - started) * 1000)
+    except Exception:
+        logger.exception("Background warming failed")
+
+@app.on_event("shutdown")
+async def _close_http_client():
+    task = getattr(app.state, "warming", None)
+    if task:
+        task.cancel()
+    if _http_client is not None:
+        await _http_client.aclose()
+
+@app.on_event("startup")
+async def _start_room_sweeper():
+    app.state.room_sweeper = room_routes.start_room_sweeper()
+
+@app.on_event("shutdown")
+async def _stop_room_sweeper():
+    task = getattr(app.state, "room_sweeper", None)
+    if task:
+        task.cancel()
+
+@app.on_event("startup")
+async def _start_location_ticker():
+    app.state.location_ticker = room_routes.start_location_ticker()
+
+@app.on_event("shutdown")
+async def _stop_location_ticker():
+    task = getattr(app.state, "location_ticker", None)
+    if task:
+        task.cancel()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        return PlainTextResponse("Forbidden", status_code=403)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # pings render every 3 mins with Better Stack Uptime, because the free plan spins down with inactivity
 @app.get("/ping", response_class=PlainTextResponse) 
 async def ping():
     return "OK"
 
 @app.get("/api/navigation/route")
-async def get_route_data(start: str, destination: str, mode: str = "foot"):
-    try:
-        # getting coords for the start and dest
-        start_coord = await geocode_nominatim(start)
-        dest_coord = await geocode_nominatim(destination)
-        # walking path data from osrm
-        route_data = await osrm_route(start_coord, dest_coord, mode)
-        return {"success": True, "start_coord": start_coord, "dest_coord": dest_coord, "route": route_data}
+async def get_route_data(request: Request, start: str, destination: str, mode: str = "foot"):
+    cache_key = (start.strip().lower(), destination.strip().lower(), mode)
+    mark_cacheable(request, ("route", cache_key))
+    handle = route_handle(cache_key)
+    # A cached body is only served while its handle is still resolvable
+    body = ROUTE_CACHE.get(cache_key) if ROUTE_HANDLES.get(handle) is not None else None
+    if body is not None:
+        with tracing.span("route-cache-hit"):
+            return PreEncodedJSONResponse(body)
+    # Cache hits skip admission; only upstream-bound work takes a slot (may raise AdmissionRejected -> 503)
+    async with admission.gate("route").slot():
+        try:
+            with tracing.span("route", mode=mode):
+                # getting coords for the start and dest
+                start_coord = await geocode_nominatim(start)
+                dest_coord = await geocode_nominatim(destination)
+                # walking path data from osrm
+                route_data = await osrm_route(start_coord, dest_coord, mode)
+                body = dumps({"success": True, "start_coord": start_coord, "dest_coord": dest_coord,
+                              "route": route_data, "route_handle": handle})
+            ROUTE_HANDLES.set(handle, {"start_coord": start_coord, "dest_coord": dest_coord, "mode": mode, "route": route_data})
+            ROUTE_CACHE.set(cache_key, body)
+            return PreEncodedJSONResponse(body)
 
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+        except Exception as e:
+            logger.warning("Route %r -> %r failed: %s", start, destination, e)
+            return {"success": False, "error": str(e)}
 
 # routing
 async def geocode_nominatim(address: str):
+    with tracing.span("geocode"):
+        return await _geocode(address)
+
+async def _geocode(address: str):
     m = _COORD_RE.match(address) # if its already lat lon then skip nominatim
     if m:
         try:
@@ -86,52 +260,51 @@ async def geocode_nominatim(address: str):
         except Exception as e:
             logger.exception("Failed parsing coords from input %r: %s", address, e)
             
-    url = "https://nominatim.openstreetmap.org/search"
+    url = f"{NOMINATIM_URL}/search"
     params = {"q": address, "format": "json", "limit": 1}
     headers = {"User-Agent": USER_AGENT}
     headers["From"] = CONTACT_EMAIL
     backoff = 0.5
     last_exc = None
+    import httpx  # deferred like the client itself; already loaded by the time this runs
     
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        for attempt in range(1, 4):  # 3 attempts
-            try:
-                logger.info("Nominatim geocode attempt %d for %s", attempt, address)
-                r = await client.get(url, params=params, headers=headers)
-                logger.info("Nominatim status=%s for %s", r.status_code, address)
-                if r.status_code != 200:
-                    last_exc = Exception(f"Nominatim status {r.status_code}: {r.text[:200]}")
-                    if 500 <= r.status_code < 600:
-                        await asyncio.sleep(backoff * attempt)
-                        continue
-                    else:
-                        break
-                json_body = r.json()
-                if not json_body:
-                    last_exc = Exception("Nominatim returned no results")
+    for attempt in range(1, 4):  # 3 attempts
+        try:
+            logger.info("Nominatim geocode attempt %d for %s", attempt, address)
+            r = await _upstream_get("nominatim", url, attempt=attempt, params=params, headers=headers, timeout=15.0)
+            logger.info("Nominatim status=%s for %s", r.status_code, address)
+            if r.status_code != 200:
+                last_exc = Exception(f"Nominatim status {r.status_code}: {r.text[:200]}")
+                if 500 <= r.status_code < 600:
+                    await _backoff(backoff * attempt)
+                    continue
+                else:
                     break
-                d = json_body[0]
-                lat = float(d["lat"])
-                lon = float(d["lon"])
-                return [lat, lon]
-            except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as e:
-                logger.exception("Nominatim attempt %d failed for %s: %s", attempt, address, e)
-                last_exc = e
-                await asyncio.sleep(backoff * attempt)
-                continue
+            json_body = r.json()
+            if not json_body:
+                last_exc = Exception("Nominatim returned no results")
+                break
+            d = json_body[0]
+            lat = float(d["lat"])
+            lon = float(d["lon"])
+            return [lat, lon]
+        except (httpx.RequestError, httpx.HTTPStatusError, ValueError) as e:
+            logger.exception("Nominatim attempt %d failed for %s: %s", attempt, address, e)
+            last_exc = e
+            await _backoff(backoff * attempt)
+            continue
 
     # Nominatim failed so try photon
     try:
-        photon_url = "https://photon.komoot.io/api/"
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            r = await client.get(photon_url, params={"q": address, "limit": 1})
-            logger.info("Photon status=%s for %s", r.status_code, address)
-            if r.status_code == 200 and r.json().get("features"):
-                feat = r.json()["features"][0]
-                coords = feat["geometry"]["coordinates"]  # [lon, lat]
-                return [float(coords[1]), float(coords[0])]
-            else:
-                logger.warning("Photon returned no results for %s: %s", address, r.text[:200])
+        photon_url = f"{PHOTON_URL}/api/"
+        r = await _upstream_get("photon", photon_url, params={"q": address, "limit": 1}, timeout=10.0)
+        logger.info("Photon status=%s for %s", r.status_code, address)
+        if r.status_code == 200 and r.json().get("features"):
+            feat = r.json()["features"][0]
+            coords = feat["geometry"]["coordinates"]  # [lon, lat]
+            return [float(coords[1]), float(coords[0])]
+        else:
+            logger.warning("Photon returned no results for %s: %s", address, r.text[:200])
     except Exception as e:
         logger.exception("Photon fallback failed for %s: %s", address, e)
         last_exc = e
@@ -140,23 +313,176 @@ async def geocode_nominatim(address: str):
     raise ValueError(f"Geocoding failed for '{address}': {last_exc}")
 
 
+def route_handle(cache_key) -> str:
+    """Opaque, stable id for a planned route; the same query always gets the same handle."""
+    return hashlib.blake2b(repr(cache_key).encode(), digest_size=8).hexdigest()
+
+@app.get("/api/navigation/route/{handle}/steps")
+async def get_route_steps(request: Request, handle: str):
+    """
+    Turn-by-turn steps for a route planned by /api/navigation/route. Planning
+    doesn't ask OSRM for steps; they are fetched the first time a client asks
+    and then served from ROUTE_CACHE until the route expires.
+    """
+    mark_cacheable(request, ("steps", handle))
+    record = ROUTE_HANDLES.get(handle)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired route handle; plan the route again")
+    body = ROUTE_CACHE.get(("steps", handle))
+    if body is not None:
+        with tracing.span("steps-cache-hit"):
+            return PreEncodedJSONResponse(body)
+
+    task = _steps_in_flight.get(handle)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_steps(handle, record))
+        _steps_in_flight[handle] = task
+        task.add_done_callback(lambda _: _steps_in_flight.pop(handle, None))
+    try:
+        # Shielded so one client disconnecting doesn't cancel the fetch for the others
+        body = await asyncio.shield(task)
+    except admission.AdmissionRejected:
+        raise
+    except Exception as e:
+        logger.warning("Steps for route %s failed: %s", handle, e)
+        return {"success": False, "error": str(e)}
+    return PreEncodedJSONResponse(body)
+
+async def _fetch_steps(handle: str, record: dict) -> bytes:
+    async with admission.gate("route").slot():
+        with tracing.span("steps", mode=record["mode"]):
+            steps = await osrm_steps(record["start_coord"], record["dest_coord"], record["mode"])
+    body = dumps({"success": True, "route_handle": handle, "steps": steps})
+    ROUTE_CACHE.set(("steps", handle), body)
+    return body
+
+@app.get("/api/navigation/route/{handle}/progress")
+async def get_route_progress(handle: str,
+                             lat: float = Query(..., ge=-90, le=90, allow_inf_nan=False),
+                             lon: float = Query(..., ge=-180, le=180, allow_inf_nan=False),
+                             accuracy: float = Query(0.0, ge=0, allow_inf_nan=False),
+                             travelled_m: Optional[float] = Query(None, ge=0, allow_inf_nan=False),
+                             reroute: bool = True):
+    """
+    Travelled/remaining distance, ETA and off-route state for a position on a
+    planned route, without asking any upstream. Pass back the last travelled_m
+    so overlapping stretches of the route resolve to the right pass.
+
+    Only when the position is off the route (and reroute is true) is a new
+    route planned, from that position to the original destination; the
+    response then carries it under "reroute" with its own route_handle.
+    """
+    record = ROUTE_HANDLES.get(handle)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired route handle; plan the route again")
+    track = record.get("track")
+    if track is None:
+        route = record["route"]
+        try:
+            track = record["track"] = nav_logic.RouteTrack(route["geometry"], route["distance_m"], route["duration_s"])
+        except ValueError as e:
+            logger.warning("No progress for route %s: %s", handle, e)
+            return {"success": False, "error": str(e)}
+    progress = track.progress(lat, lon, accuracy, travelled_m)
+    result = {"success": True, "route_handle": handle, "progress": progress}
+    if progress["off_route"] and reroute:
+        try:
+            result["reroute"] = await _reroute(record, [lat, lon])
+        except admission.AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.warning("Reroute from %s,%s for route %s failed: %s", lat, lon, handle, e)
+            result["reroute"] = None
+            result["error"] = str(e)
+    return result
+
+async def _reroute(record: dict, position) -> dict:
+    # ~10 m buckets, so repeated fixes from the same spot reuse one plan
+    cache_key = ("reroute", round(position[0], 4), round(position[1], 4), tuple(record["dest_coord"]), record["mode"])
+    handle = route_handle(cache_key)
+    existing = ROUTE_HANDLES.get(handle)
+    if existing is None:
+        async with admission.gate("route").slot():
+            with tracing.span("reroute", mode=record["mode"]):
+                route_data = await osrm_route(position, record["dest_coord"], record["mode"])
+        existing = {"start_coord": position, "dest_coord": record["dest_coord"], "mode": record["mode"], "route": route_data}
+        ROUTE_HANDLES.set(handle, existing)
+    return {"route_handle": handle, "start_coord": existing["start_coord"],
+            "dest_coord": existing["dest_coord"], "route": existing["route"]}
+
 async def osrm_route(from_coord, to_coord, mode="foot"): #osrm
+    with tracing.span("osrm", mode=mode):
+        # Steps are left out here; get_route_steps asks for them only when a client wants them
+        route = await _osrm_request(from_coord, to_coord, mode, {"overview": "full", "geometries": "geojson", "steps": "false"})
+    geometry = [[p[1], p[0]] for p in route["geometry"]["coordinates"]]
+
+    return {
+        "distance_m": route["distance"],
+        "duration_s": route["duration"],
+        "geometry": geometry
+    }
+
+async def osrm_steps(from_coord, to_coord, mode="foot"):
+    with tracing.span("osrm", mode=mode, steps=True):
+        # No overview geometry: the client already has it from the route response
+        route = await _osrm_request(from_coord, to_coord, mode, {"overview": "false", "steps": "true"})
+    steps = []
+    for leg in route.get("legs", []):
+        for step in leg.get("steps", []):
+            maneuver = step.get("maneuver", {})
+            lon, lat = maneuver.get("location", (None, None))
+            steps.append({
+                "instruction": _step_instruction(step),
+                "name": step.get("name", ""),
+                "distance_m": step.get("distance", 0.0),
+                "duration_s": step.get("duration", 0.0),
+                "location": [lat, lon],
+                "maneuver": maneuver.get("type"),
+                "modifier": maneuver.get("modifier"),
+            })
+    return steps
+
+_COMPASS = ("north", "northeast", "east", "southeast", "south", "southwest", "west", "northwest")
+
+def _step_instruction(step: dict) -> str:
+    """Plain-English text for an OSRM step (OSRM itself only returns the maneuver)."""
+    maneuver = step.get("maneuver", {})
+    kind = maneuver.get("type", "")
+    modifier = maneuver.get("modifier", "")
+    name = step.get("name") or ""
+    onto = f" onto {name}" if name else ""
+
+    if kind == "depart":
+        heading = _COMPASS[int(((maneuver.get("bearing_after", 0) + 22.5) % 360) // 45)]
+        return f"Head {heading}" + (f" on {name}" if name else "")
+    if kind == "arrive":
+        side = f" on the {modifier}" if modifier in ("left", "right") else ""
+        return f"Arrive at your destination{side}"
+    if kind in ("roundabout", "rotary"):
+        exit_number = maneuver.get("exit")
+        return "Enter the roundabout" + (f" and take exit {exit_number}" if exit_number else "") + onto
+    if kind in ("new name", "continue") or modifier in ("straight", ""):
+        return f"Continue{onto}" if name else "Continue straight"
+    if modifier == "uturn":
+        return f"Make a U-turn{onto}"
+    return f"Turn {modifier}{onto}"
+
+async def _osrm_request(from_coord, to_coord, mode, params):
+    """First route from the first OSRM mirror that answers Ok."""
     coords = f"{from_coord[1]},{from_coord[0]};{to_coord[1]},{to_coord[0]}"
-    params = {"overview": "full", "geometries": "geojson", "steps": "true"}
 
     # Primary + backup OSRM servers
     OSRM_URLS = [
-        f"https://router.project-osrm.org/route/v1/{mode}/{coords}",
-        f"https://routing.openstreetmap.de/routed-car/route/v1/{mode}/{coords}",
-        f"https://routing.openstreetmap.de/routed-foot/route/v1/{mode}/{coords}",
+        ("osrm-project", f"{OSRM_PROJECT_URL}/route/v1/{mode}/{coords}"),
+        ("osrm-fossgis-car", f"{OSRM_FOSSGIS_URL}/routed-car/route/v1/{mode}/{coords}"),
+        ("osrm-fossgis-foot", f"{OSRM_FOSSGIS_URL}/routed-foot/route/v1/{mode}/{coords}"),
     ]
 
     last_error = None
 
-    for url in OSRM_URLS:
+    for attempt, (upstream, url) in enumerate(OSRM_URLS, start=1):
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                r = await client.get(url, params=params)
+            r = await _upstream_get(upstream, url, attempt=attempt, params=params, timeout=30.0)
 
             if r.status_code != 200:
                 last_error = f"OSRM status {r.status_code} from {url}"
@@ -167,14 +493,7 @@ async def osrm_route(from_coord, to_coord, mode="foot"): #osrm
                 last_error = f"OSRM code {data.get('code')} from {url}"
                 continue
 
-            route = data["routes"][0]
-            geometry = [[p[1], p[0]] for p in route["geometry"]["coordinates"]]
-
-            return {
-                "distance_m": route["distance"],
-                "duration_s": route["duration"],
-                "geometry": geometry
-            }
+            return data["routes"][0]
 
         except Exception as e:
             last_error = str(e)
@@ -185,7 +504,7 @@ async def osrm_route(from_coord, to_coord, mode="foot"): #osrm
 @app.get("/api/navigation/reverse")
 async def reverse_geocode(lat: float, lon: float):
     try:
-        url = "https://nominatim.openstreetmap.org/reverse"
+        url = f"{NOMINATIM_URL}/reverse"
         params = {
             "lat": lat,
             "lon": lon,
@@ -193,8 +512,8 @@ async def reverse_geocode(lat: float, lon: float):
         }
         headers = {"User-Agent": USER_AGENT}
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            r = await client.get(url, params=params, headers=headers)
+        async with admission.gate("reverse").slot():
+            r = await _upstream_get("nominatim-reverse", url, params=params, headers=headers, timeout=60.0)
 
         data = r.json()
 
@@ -204,9 +523,13 @@ async def reverse_geocode(lat: float, lon: float):
 
         return {"success": True, "address": address, "raw": data}
 
+    except admission.AdmissionRejected:
+        raise
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 if __name__ =="__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    import uvicorn
+    # permessage-deflate for /api/rooms/ws (needs the "websockets" implementation)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, ws="websockets")
 
@@ -0,0 +1,216 @@
+"""
+-------------------------------------------------------
+metrics.py is the in-process Prometheus-style metrics registry
+-------------------------------------------------------
+Counters, gauges and histograms with label support, rendered in the
+Prometheus text exposition format at /metrics. Each metric family guards its
+values with one uncontended lock held for a dict lookup and an add, so
+recording stays cheap enough to leave on in production. Values that already
+live elsewhere (cache hit counts, socket counts) are read at scrape time
+through register_collector() instead of being mirrored on every change.
+-------------------------------------------------------
+"""
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: List["_Metric"] = []
+_COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            items = sorted((labels, (list(e[0]), e[1], e[2])) for labels, e in self._values.items())
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels_text(self.labelnames, labels, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """
+    Registers a scrape-time callback yielding (name, kind, help, labels, value).
+    """
+    _COLLECTORS.append(collector)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    # Samples of one family must be contiguous, so group collector output by name
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _COLLECTORS:
+        for name, kind, documentation, labels, value in collector():
+            family = families.setdefault(name, (kind, documentation, []))
+            family[2].append(f"{name}{_labels_text(list(labels), list(labels.values()))} {value}")
+    for name, (kind, documentation, samples) in families.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+# Shared metrics
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+upstream_request_duration_seconds = Histogram(
+    "upstream_request_duration_seconds", "Outbound HTTP call latency by upstream.", ("upstream", "outcome")
+)
+cache_requests_total = Counter("cache_requests_total", "Lookups against caches without a TTLCache.", ("cache", "result"))
+websocket_broadcast_seconds = Histogram(
+    "websocket_broadcast_seconds", "Time to fan one event out to every socket.", ("channel",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+websocket_broadcast_recipients = Histogram(
+    "websocket_broadcast_recipients", "Sockets reached per broadcast.", ("channel",),
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+
+
+def register_cache(name: str, cache) -> None:
+    """Exposes a TTLCache's hits/misses/size at scrape time."""
+    def collect():
+        yield "cache_hits_total", "counter", "Cache hits since start.", {"cache": name}, cache.hits
+        yield "cache_misses_total", "counter", "Cache misses since start.", {"cache": name}, cache.misses
+        total = cache.hits + cache.misses
+        yield "cache_hit_ratio", "gauge", "Cache hit ratio since start.", {"cache": name}, (cache.hits / total) if total else 0.0
+        yield "cache_entries", "gauge", "Entries currently cached.", {"cache": name}, len(cache)
+    register_collector(collect)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and in-flight count per route template
+    (e.g. /api/chat/{room_id}/messages) rather than per raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status = ["500"]
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            http_request_duration_seconds.observe(time.perf_counter() - start, method, template)
+            http_requests_total.inc(method, template, status[0])
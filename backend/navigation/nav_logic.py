@@ -1 +1,190 @@
-#nav_logic
+"""
+nav_logic.py
+
+Progress along a planned route: distance travelled, distance remaining, ETA
+and whether a position is off the route.
+
+A RouteTrack is built once per route from the osrm_route geometry. Points are
+projected to local metres (equirectangular around the route's mid latitude,
+plenty accurate at walking scale) and cumulative segment lengths are
+precomputed, so progress is "cumulative length up to the nearest segment +
+the projection onto it". Nearest-segment projection is done in one vectorized
+pass with numpy when it is installed, and with a plain loop otherwise. Long
+routes also get a uniform grid of segment ids, so a fix only has to be
+compared with the segments in the cells around it.
+"""
+
+import math
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+OFF_ROUTE_METERS = float(os.getenv("OFF_ROUTE_METERS", "35"))
+# GPS accuracy above this is not allowed to widen the off-route threshold any further
+MAX_ACCURACY_SLACK_METERS = 50.0
+# Routes with more segments than this get a grid index
+GRID_MIN_SEGMENTS = 64
+GRID_CELL_METERS = 50.0
+# Nearest segments within this much of each other count as a tie (out-and-back routes);
+# the one closest to the caller's previous progress wins
+TIE_METERS = 5.0
+
+EARTH_RADIUS_M = 6371008.8
+
+_numpy = None
+
+
+def _np():
+    """numpy if it is installed, imported on first use (it is a noticeable slice of cold start)."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:  # optional dependency
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+class RouteTrack:
+    """
+    Precomputed geometry for one route. geometry is [[lat, lon], ...] as
+    returned by osrm_route; distance_m/duration_s give the pace for ETAs.
+    """
+
+    def __init__(self, geometry: Sequence[Sequence[float]], distance_m: float, duration_s: float):
+        if not geometry:
+            raise ValueError("Route has no geometry")
+        if len(geometry) == 1:
+            # Start == destination: one zero-length segment, so progress reads as arrived
+            geometry = [geometry[0], geometry[0]]
+        lat0 = math.radians(sum(p[0] for p in geometry) / len(geometry))
+        self._kx = EARTH_RADIUS_M * math.cos(lat0) * math.pi / 180.0
+        self._ky = EARTH_RADIUS_M * math.pi / 180.0
+        xs = [p[1] * self._kx for p in geometry]
+        ys = [p[0] * self._ky for p in geometry]
+
+        # Segment i runs from point i to point i + 1
+        self._ax, self._ay = xs[:-1], ys[:-1]
+        self._dx = [xs[i + 1] - xs[i] for i in range(len(xs) - 1)]
+        self._dy = [ys[i + 1] - ys[i] for i in range(len(ys) - 1)]
+        self._len = [math.hypot(dx, dy) for dx, dy in zip(self._dx, self._dy)]
+        cumulative = [0.0]
+        for length in self._len:
+            cumulative.append(cumulative[-1] + length)
+        self._cum = cumulative
+        self.length_m = cumulative[-1]
+        # OSRM's own pace for this route; falls back to walking speed for degenerate routes
+        self.seconds_per_meter = (duration_s / distance_m) if distance_m and duration_s else 1 / 1.4
+
+        np = _np()
+        if np is not None:
+            self._arrays = tuple(np.asarray(v, dtype=float) for v in (self._ax, self._ay, self._dx, self._dy, self._len, cumulative[:-1]))
+        else:
+            self._arrays = None
+        self._grid = self._build_grid() if len(self._len) > GRID_MIN_SEGMENTS else None
+
+    def __len__(self) -> int:
+        return len(self._len)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / GRID_CELL_METERS)), int(math.floor(y / GRID_CELL_METERS))
+
+    def _build_grid(self) -> Dict[Tuple[int, int], List[int]]:
+        """cell -> ids of the segments whose bounding box touches it."""
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        for i, (ax, ay, dx, dy) in enumerate(zip(self._ax, self._ay, self._dx, self._dy)):
+            cx0, cy0 = self._cell(min(ax, ax + dx), min(ay, ay + dy))
+            cx1, cy1 = self._cell(max(ax, ax + dx), max(ay, ay + dy))
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    grid.setdefault((cx, cy), []).append(i)
+        return grid
+
+    def _candidates(self, x: float, y: float, radius: float) -> Optional[List[int]]:
+        """Segments that could lie within radius of (x, y); None means scan them all."""
+        if self._grid is None:
+            return None
+        cx, cy = self._cell(x, y)
+        reach = int(math.ceil(radius / GRID_CELL_METERS))
+        found = set()
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                found.update(self._grid.get((i, j), ()))
+        return sorted(found)
+
+    def _nearest(self, x: float, y: float, segments: Optional[List[int]], prefer_along: Optional[float]) -> Tuple[float, float]:
+        """(distance along the route, distance from it) for the nearest of `segments`."""
+        if self._arrays is not None:
+            np = _numpy
+            dists, alongs = self._project_numpy(x, y, segments)
+            best = int(dists.argmin())
+            if prefer_along is not None:
+                ties = np.flatnonzero(dists <= dists[best] + TIE_METERS)
+                best = int(ties[np.abs(alongs[ties] - prefer_along).argmin()])
+            return float(alongs[best]), float(dists[best])
+
+        dists, alongs = self._project_python(x, y, segments)
+        best = min(range(len(dists)), key=dists.__getitem__)
+        if prefer_along is not None:
+            # Where the route doubles back on itself, stay on the pass the walker is on
+            ties = [k for k in range(len(dists)) if dists[k] <= dists[best] + TIE_METERS]
+            best = min(ties, key=lambda k: abs(alongs[k] - prefer_along))
+        return alongs[best], dists[best]
+
+    def _project_numpy(self, x: float, y: float, segments: Optional[List[int]]):
+        np = _numpy
+        ax, ay, dx, dy, length, cum = self._arrays
+        if segments is not None:
+            idx = np.asarray(segments, dtype=np.intp)
+            ax, ay, dx, dy, length, cum = ax[idx], ay[idx], dx[idx], dy[idx], length[idx], cum[idx]
+        len2 = length * length
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(len2 > 0, ((x - ax) * dx + (y - ay) * dy) / len2, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        dists = np.hypot(ax + t * dx - x, ay + t * dy - y)
+        return dists, cum + t * length
+
+    def _project_python(self, x: float, y: float, segments: Optional[List[int]]):
+        dists, alongs = [], []
+        for i in (range(len(self._len)) if segments is None else segments):
+            ax, ay, dx, dy, length = self._ax[i], self._ay[i], self._dx[i], self._dy[i], self._len[i]
+            t = ((x - ax) * dx + (y - ay) * dy) / (length * length) if length > 0 else 0.0
+            t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+            dists.append(math.hypot(ax + t * dx - x, ay + t * dy - y))
+            alongs.append(self._cum[i] + t * length)
+        return dists, alongs
+
+    def progress(self, lat: float, lon: float, accuracy: float = 0.0, previous_m: Optional[float] = None) -> Dict:
+        """
+        Where (lat, lon) is along the route.
+
+        Args:
+            accuracy: the fix's reported accuracy in metres; widens the off-route threshold
+            previous_m: the caller's last travelled_m, to disambiguate overlapping passes
+
+        Returns:
+            travelled_m, remaining_m, total_m, fraction, offset_m, off_route, eta_s
+        """
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            # NaN would silently compare as on-route, inf overflows the grid lookup
+            raise ValueError("Position must be finite")
+        x, y = lon * self._kx, lat * self._ky
+        threshold = OFF_ROUTE_METERS + min(max(accuracy, 0.0), MAX_ACCURACY_SLACK_METERS)
+        candidates = self._candidates(x, y, threshold)
+        if candidates:
+            along, offset = self._nearest(x, y, candidates, previous_m)
+        else:
+            along, offset = float("inf"), float("inf")
+        if offset > threshold:
+            # Nothing close by in the grid (or no grid): the full scan decides how far off we are
+            along, offset = self._nearest(x, y, None, previous_m)
+        remaining = max(0.0, self.length_m - along)
+        return {
+            "travelled_m": round(along, 1),
+            "remaining_m": round(remaining, 1),
+            "total_m": round(self.length_m, 1),
+            "fraction": round(along / self.length_m, 4) if self.length_m else 1.0,
+            "offset_m": round(offset, 1),
+            "off_route": offset > threshold,
+            "eta_s": round(remaining * self.seconds_per_meter, 1),
+        }
@@ -0,0 +1,210 @@
+"""
+-------------------------------------------------------
+persistence.py snapshots and restores the in-memory stores
+-------------------------------------------------------
+State directory layout (STATE_DIR, default ./state; set it empty to disable):
+    snapshot.bin           latest full snapshot (pickle, loaded through mmap)
+    journal-000042.bin     append-only mutation segments (see backend/journal.py)
+
+A snapshot first rotates the journal to a new segment, then takes shallow
+copies of the stores on the event loop (cheap: message dicts and member lists
+are shared rather than copied, which relies on the stores replacing them on
+change, renames included, instead of mutating them in place), and
+serializes/writes them on a worker thread. The snapshot records the first
+segment it does not cover, so restore() loads it and replays only the
+segments from there on. Older segments are deleted once the snapshot is on disk.
+-------------------------------------------------------
+"""
+import asyncio
+import glob
+import logging
+import mmap
+import os
+import pickle
+import re
+import time
+from typing import Dict
+
+from backend import journal
+from backend.auth import auth_storage, session_tokens
+from backend.walkingbuddy.database import ROOMS_DB, CHAT_DB, ROOM_ACTIVITY, RoomDatabase, ChatDatabase
+
+logger = logging.getLogger("uvicorn.error")
+
+STATE_DIR = os.getenv("STATE_DIR", "./state")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))
+SNAPSHOT_FORMAT_VERSION = 1
+
+_SEGMENT_RE = re.compile(r"journal-(\d+)\.bin$")
+_next_segment = 1
+
+
+def enabled() -> bool:
+    return bool(STATE_DIR)
+
+
+def _snapshot_path() -> str:
+    return os.path.join(STATE_DIR, "snapshot.bin")
+
+
+def _segment_path(seq: int) -> str:
+    return os.path.join(STATE_DIR, f"journal-{seq:06d}.bin")
+
+
+def _segments() -> Dict[int, str]:
+    out = {}
+    for path in glob.glob(os.path.join(STATE_DIR, "journal-*.bin")):
+        m = _SEGMENT_RE.search(path)
+        if m:
+            out[int(m.group(1))] = path
+    return dict(sorted(out.items()))
+
+
+def _capture(journal_seq: int) -> dict:
+    return {
+        "format": SNAPSHOT_FORMAT_VERSION,
+        "journal_seq": journal_seq,
+        "taken_at": time.time(),
+        "users": [dict(u) for u in list(auth_storage.USERS_BY_ID.values())],
+        "rooms": [dict(r) for r in list(ROOMS_DB.values())],
+        "chats": {rid: list(msgs) for rid, msgs in list(CHAT_DB.items())},
+        "activity": dict(ROOM_ACTIVITY),
+        "revoked": session_tokens.revoked_claims(),
+    }
+
+
+def _write_snapshot(state: dict) -> int:
+    data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = _snapshot_path() + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _snapshot_path())
+    return len(data)
+
+
+def _load_snapshot() -> dict:
+    path = _snapshot_path()
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return pickle.loads(mm)
+
+
+def _apply(record: tuple) -> None:
+    op, ts, *args = record
+    if op == "user.put":
+        auth_storage.load_user(args[0])
+    elif op == "room.put":
+        RoomDatabase.load_room(args[0], activity=ts)
+    elif op == "room.del":
+        try:
+            RoomDatabase.delete_room(args[0])
+        except ValueError:
+            pass
+    elif op == "chat.append":
+        room_id, index, msg = args
+        ChatDatabase.load_message(room_id, index, msg)
+        if room_id in ROOMS_DB:
+            ROOM_ACTIVITY[room_id] = ts
+    elif op == "chat.clear":
+        ChatDatabase.clear_room_chat(args[0])
+    elif op == "chat.rename":
+        ChatDatabase.rename_author(*args)
+    elif op == "session.revoke":
+        session_tokens.load_revocation(*args)
+    else:
+        logger.warning("Skipping unknown journal op %r", op)
+
+
+def restore() -> dict:
+    """
+    Loads the latest snapshot, replays the journal after it, then opens a
+    fresh journal segment for new mutations.
+
+    Returns:
+        Dict of restore stats (users, rooms, replayed records, elapsed ms)
+    """
+    global _next_segment
+    if not enabled():
+        return {}
+    started = time.perf_counter()
+    os.makedirs(STATE_DIR, exist_ok=True)
+
+    state = _load_snapshot()
+    for user in state.get("users", []):
+        auth_storage.load_user(user)
+    activity = state.get("activity", {})
+    for room in state.get("rooms", []):
+        RoomDatabase.load_room(room, activity=activity.get(room["room_id"]))
+    for room_id, msgs in state.get("chats", {}).items():
+        if room_id in CHAT_DB:
+            ChatDatabase.load_history(room_id, msgs)
+    for jti, exp in state.get("revoked", {}).items():
+        session_tokens.load_revocation(jti, exp)
+
+    replayed = 0
+    first_seq = state.get("journal_seq", 0)
+    segments = _segments()
+    for seq, path in segments.items():
+        if seq < first_seq:
+            continue
+        for record in journal.read_segment(path):
+            _apply(record)
+            replayed += 1
+
+    _next_segment = max([first_seq, *segments.keys()], default=0) + 1
+    journal.open_segment(_segment_path(_next_segment))
+    _next_segment += 1
+
+    stats = {
+        "users": len(auth_storage.USERS_BY_ID),
+        "rooms": len(ROOMS_DB),
+        "replayed": replayed,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+    logger.info("Restored state from %s: %s", STATE_DIR, stats)
+    return stats
+
+
+async def snapshot() -> int:
+    """
+    Writes a snapshot without blocking the event loop.
+
+    Returns:
+        Size of the snapshot in bytes
+    """
+    global _next_segment
+    if not enabled() or not journal.is_open():
+        return 0
+    seq = _next_segment
+    _next_segment += 1
+    journal.open_segment(_segment_path(seq))
+    state = _capture(seq)
+    loop = asyncio.get_running_loop()
+    size = await loop.run_in_executor(None, _write_snapshot, state)
+    for old_seq, path in _segments().items():
+        if old_seq < seq:
+            try:
+                os.remove(path)
+            except OSError:
+                logger.warning("Could not remove old journal segment %s", path)
+    logger.info("Wrote snapshot (%d bytes, %d rooms)", size, len(state["rooms"]))
+    return size
+
+
+async def run_periodic() -> None:
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            await snapshot()
+        except Exception:
+            logger.exception("Periodic snapshot failed")
+
+
+async def shutdown() -> None:
+    try:
+        await snapshot()
+    finally:
+        await asyncio.wrap_future(journal.close_segment())
@@ -0,0 +1,261 @@
+"""
+-------------------------------------------------------
+profiling.py is opt-in statistical CPU and allocation profiling
+-------------------------------------------------------
+Hot functions are wrapped with @profiled("name"). A call is captured when
+    - the request carries X-Profile: <PROFILE_ADMIN_TOKEN>, or
+    - a PROFILE_SAMPLE_RATE coin flip says so (also covers calls made
+      outside a request, e.g. broadcasts from the room sweeper).
+Otherwise the wrapper costs one contextvar read and one random().
+
+While a capture is open, a background thread samples the capturing thread's
+stack every PROFILE_INTERVAL_MS. Only samples whose stack contains the
+profiled function are kept (so other tasks interleaved on the event loop are
+not charged to it), and stacks are trimmed to start at that function.
+tracemalloc runs for the duration of the capture to record bytes allocated.
+
+Output in PROFILE_DIR (collapsed-stack format, feed to flamegraph.pl or speedscope):
+    <name>.collapsed                  cumulative samples over every capture
+    <name>.alloc.txt                  cumulative allocation summary
+    <name>-<time>-<trace>.collapsed   one admin-requested capture
+    <name>-<time>-<trace>.alloc.txt   its top allocation sites
+Handlers here take microseconds, so single captures often hold few samples;
+the cumulative files are where sampled-rate profiling becomes useful.
+-------------------------------------------------------
+"""
+import asyncio
+import functools
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+
+from backend import tracing
+
+logger = logging.getLogger("uvicorn.error")
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_FLUSH_EVERY = int(os.getenv("PROFILE_FLUSH_EVERY", "50"))
+PROFILE_ALLOC_TOP = 15
+
+_requested: ContextVar[bool] = ContextVar("walkingbuddy_profile_requested", default=False)
+_active_capture: ContextVar[Optional["_Capture"]] = ContextVar("walkingbuddy_profile_capture", default=None)
+
+
+class _Capture:
+    __slots__ = ("name", "code", "thread_id", "requested", "samples", "alloc_before", "started")
+
+    def __init__(self, name: str, code, requested: bool):
+        self.name = name
+        self.code = code
+        self.thread_id = threading.get_ident()
+        self.requested = requested
+        self.samples: Counter = Counter()
+        self.alloc_before = 0
+        self.started = 0.0
+
+
+class _Totals:
+    __slots__ = ("samples", "captures", "alloc_bytes", "alloc_peak", "seconds")
+
+    def __init__(self):
+        self.samples: Counter = Counter()
+        self.captures = 0
+        self.alloc_bytes = 0
+        self.alloc_peak = 0
+        self.seconds = 0.0
+
+
+_LOCK = threading.Lock()
+_ACTIVE: Dict[int, _Capture] = {}
+_TOTALS: Dict[str, _Totals] = {}
+_sampler: Optional[threading.Thread] = None
+_tracemalloc_users = 0
+# True when tracemalloc was started here, so the last capture may stop it; tracing
+# someone else started (e.g. PYTHONTRACEMALLOC) is left running
+_tracemalloc_owned = False
+
+
+def _collapse(frame, code) -> Optional[str]:
+    """Returns "outer;...;leaf" from `code`'s frame down to the leaf, or None if `code` is not on the stack."""
+    names = []
+    while frame is not None:
+        co = frame.f_code
+        names.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+        if co is code:
+            names.reverse()
+            return ";".join(names)
+        frame = frame.f_back
+    return None
+
+
+def _sample_loop() -> None:
+    global _sampler
+    interval = PROFILE_INTERVAL_MS / 1000.0
+    while True:
+        frames = sys._current_frames()
+        with _LOCK:
+            if not _ACTIVE:
+                _sampler = None
+                return
+            for capture in _ACTIVE.values():
+                frame = frames.get(capture.thread_id)
+                stack = _collapse(frame, capture.code) if frame is not None else None
+                if stack:
+                    capture.samples[stack] += 1
+        del frames
+        time.sleep(interval)
+
+
+def _begin(name: str, code) -> Optional[_Capture]:
+    global _sampler, _tracemalloc_users, _tracemalloc_owned
+    if _active_capture.get() is not None:
+        return None  # already inside a capture (e.g. a handler calling broadcast)
+    requested = _requested.get()
+    if not requested and (PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE):
+        return None
+    capture = _Capture(name, code, requested)
+    with _LOCK:
+        _ACTIVE[id(capture)] = capture
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name="profiler-sampler", daemon=True)
+            _sampler.start()
+    capture.alloc_before = tracemalloc.get_traced_memory()[0]
+    capture.started = time.perf_counter()
+    _active_capture.set(capture)
+    return capture
+
+
+def _end(capture: _Capture) -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    elapsed = time.perf_counter() - capture.started
+    current, peak = tracemalloc.get_traced_memory()
+    allocated = max(current - capture.alloc_before, 0)
+    top = None
+    if capture.requested:
+        top = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_ALLOC_TOP]
+    _active_capture.set(None)
+    with _LOCK:
+        _ACTIVE.pop(id(capture), None)
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+        totals = _TOTALS.setdefault(capture.name, _Totals())
+        totals.samples.update(capture.samples)
+        totals.captures += 1
+        totals.alloc_bytes += allocated
+        totals.alloc_peak = max(totals.alloc_peak, peak)
+        totals.seconds += elapsed
+        flush = capture.requested or totals.captures % PROFILE_FLUSH_EVERY == 0
+        if flush:
+            cumulative = (dict(totals.samples), totals.captures, totals.alloc_bytes, totals.alloc_peak, totals.seconds)
+
+    if capture.requested:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        prefix = f"{capture.name}-{stamp}-{tracing.current_trace_id() or 'untraced'}"
+        alloc = [f"{capture.name}: {elapsed * 1000:.3f} ms, {allocated} bytes allocated, process peak {peak} bytes", ""]
+        alloc.extend(str(stat) for stat in top)
+        _write({
+            prefix + ".collapsed": _collapsed_text(capture.samples),
+            prefix + ".alloc.txt": "\n".join(alloc) + "\n",
+        })
+    if flush:
+        samples, captures, alloc_bytes, alloc_peak, seconds = cumulative
+        _write({
+            capture.name + ".collapsed": _collapsed_text(samples),
+            capture.name + ".alloc.txt": (
+                f"{capture.name}: {captures} captures, {seconds * 1000 / captures:.3f} ms avg, "
+                f"{alloc_bytes // captures} bytes allocated avg, process peak {alloc_peak} bytes\n"
+            ),
+        })
+
+
+def _collapsed_text(samples) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(samples.items()))
+
+
+def _write_files(files: Dict[str, str]) -> None:
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        for filename, text in files.items():
+            with open(os.path.join(PROFILE_DIR, filename), "w", encoding="utf-8") as f:
+                f.write(text)
+    except OSError:
+        logger.exception("Could not write profile output to %s", PROFILE_DIR)
+
+
+def _write(files: Dict[str, str]) -> None:
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _write_files, files)
+    except RuntimeError:
+        _write_files(files)
+
+
+def profiled(name: str):
+    """
+    Decorator marking a sync or async function as a profiling target.
+    """
+    def decorate(func):
+        code = func.__code__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                capture = _begin(name, code)
+                if capture is None:
+                    return await func(*args, **kwargs)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _end(capture)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            capture = _begin(name, code)
+            if capture is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _end(capture)
+        return wrapper
+    return decorate
+
+
+class ProfilingMiddleware:
+    """Flags the request for profiling when X-Profile carries the admin token."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_ADMIN_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        supplied = Headers(scope=scope).get("x-profile", "")
+        if not supplied or not hmac.compare_digest(supplied.encode(), PROFILE_ADMIN_TOKEN.encode()):
+            await self.app(scope, receive, send)
+            return
+        token = _requested.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _requested.reset(token)
@@ -0,0 +1,55 @@
+"""
+-------------------------------------------------------
+serialization.py is the JSON encoding layer for responses and WebSocket frames
+-------------------------------------------------------
+Uses orjson when it is installed and falls back to the stdlib json module.
+FastJSONResponse is the app's default response class. Handlers on hot paths
+return a response object directly, which skips FastAPI's jsonable_encoder pass,
+and can cache the encoded bytes with PreEncodedJSONResponse.
+-------------------------------------------------------
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(obj: Any):
+    # Same fallbacks jsonable_encoder would apply to the types we actually store
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if hasattr(obj, "keys"):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_text(obj: Any) -> str:
+    """Encodes to str for WebSocket text frames."""
+    return dumps(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class PreEncodedJSONResponse(Response):
+    """Response for a body that is already JSON-encoded bytes."""
+    media_type = "application/json"
@@ -0,0 +1,187 @@
+"""
+-------------------------------------------------------
+tracing.py is lightweight per-request span tracing
+-------------------------------------------------------
+TracingMiddleware starts a trace for every HTTP request (reusing an incoming
+X-Trace-Id if present) and code wraps interesting work in `with span(...)`.
+On the way out the middleware adds:
+    X-Trace-Id      the id that also appears in every log line of the request
+    Server-Timing   per-span durations, shown in the browser devtools
+A TRACE_SAMPLE_RATE fraction of traces is appended as one JSON line each to
+TRACE_EXPORT_PATH. Outside a request span() does nothing, so instrumented
+helpers are safe to call from background tasks.
+-------------------------------------------------------
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "./traces.jsonl")
+# Origins whose pages may read Server-Timing through the Resource Timing API; empty sends no header
+TIMING_ALLOW_ORIGIN = os.getenv("TIMING_ALLOW_ORIGIN", "")
+MAX_SERVER_TIMING_ENTRIES = 20
+
+_export_lock = threading.Lock()
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "next_id")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Dict] = []
+        self.next_id = 1
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("walkingbuddy_trace", default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar("walkingbuddy_span", default=None)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the enclosed block as a child of the current span.
+    Yields the span dict (or None outside a trace) so callers can add attributes.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    span_id = trace.next_id
+    trace.next_id += 1
+    record = {"id": span_id, "parent": _current_span.get(), "name": name, "attrs": attrs, "start": time.perf_counter()}
+    token = _current_span.set(span_id)
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        record["duration_ms"] = round((time.perf_counter() - record["start"]) * 1000, 3)
+        trace.spans.append(record)
+
+
+def server_timing(trace: Trace) -> str:
+    entries = []
+    counts: Dict[str, int] = {}
+    for record in trace.spans[:MAX_SERVER_TIMING_ENTRIES]:
+        # Server-Timing names are tokens; repeat spans (retries) get a numeric suffix
+        base = "".join(c if c.isalnum() or c in "-_" else "-" for c in record["name"])
+        counts[base] = counts.get(base, 0) + 1
+        metric = base if counts[base] == 1 else f"{base}-{counts[base]}"
+        entries.append(f"{metric};dur={record['duration_ms']}")
+    return ", ".join(entries)
+
+
+def _export(line: str) -> None:
+    with _export_lock:
+        with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _export_trace(trace: Trace, method: str, path: str, status: int) -> None:
+    root_start = min((s["start"] for s in trace.spans), default=0.0)
+    spans = [
+        {k: (round((v - root_start) * 1000, 3) if k == "start" else v) for k, v in s.items()}
+        for s in sorted(trace.spans, key=lambda s: s["id"])
+    ]
+    line = json.dumps({
+        "trace_id": trace.trace_id, "ts": time.time(), "method": method, "path": path,
+        "status": status, "spans": spans,
+    }, default=str)
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _export, line)
+    except RuntimeError:
+        _export(line)
+
+
+class TraceLogFilter(logging.Filter):
+    """Sets record.trace_id to the active trace id (None outside a request); the message is left alone."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "trace_id", None) is None:
+            record.trace_id = current_trace_id()
+        return True
+
+
+class TraceFormatter(logging.Formatter):
+    """Wraps a handler's formatter and ends the first line with " [trace=<id>]" when record.trace_id is set."""
+
+    def __init__(self, inner: Optional[logging.Formatter]):
+        super().__init__()
+        self.inner = inner or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = self.inner.format(record)
+        trace_id = getattr(record, "trace_id", None)
+        if not trace_id:
+            return text
+        first, newline, rest = text.partition("\n")
+        return f"{first} [trace={trace_id}]{newline}{rest}"
+
+
+def install_log_filter(logger_names=("", "uvicorn", "uvicorn.error")) -> None:
+    """
+    Attaches TraceLogFilter and TraceFormatter to the handlers of the given
+    loggers (call after logging is configured).
+    """
+    log_filter = TraceLogFilter()
+    for name in logger_names:
+        for handler in logging.getLogger(name).handlers:
+            if not any(isinstance(f, TraceLogFilter) for f in handler.filters):
+                handler.addFilter(log_filter)
+            if not isinstance(handler.formatter, TraceFormatter):
+                handler.setFormatter(TraceFormatter(handler.formatter))
+
+
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = Headers(scope=scope).get("x-trace-id", "")
+        trace_id = incoming[:64] if incoming.isalnum() else uuid.uuid4().hex[:16]
+        trace = Trace(trace_id, sampled=bool(TRACE_EXPORT_PATH) and random.random() < TRACE_SAMPLE_RATE)
+        trace_token = _current_trace.set(trace)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers["X-Trace-Id"] = trace_id
+                timing = server_timing(trace)
+                if timing:
+                    headers["Server-Timing"] = timing
+                    if TIMING_ALLOW_ORIGIN:
+                        headers["Timing-Allow-Origin"] = TIMING_ALLOW_ORIGIN
+            await send(message)
+
+        try:
+            with span("request", method=scope["method"], path=scope["path"]):
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(trace_token)
+            if trace.sampled:
+                _export_trace(trace, scope["method"], scope["path"], status[0])
@@ -5,18 +5,82 @@ Sinthujan Jayaranjan
 This file handles all chat related operations which include:
 - Sending messages within a room
 - Retrieving message history
+- Long-polling for new messages (for clients without a WebSocket)
+- Searching a room's message history
 - Clearing chat history
 """
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Callable
+import asyncio
+import os
 from .database import ChatDatabase, RoomDatabase
+from . import search
 
+from backend import serialization, profiling, metrics, idempotency
 from backend.auth import auth_storage
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
+# Longest a /poll request is held open; kept under typical proxy idle timeouts
+CHAT_LONG_POLL_MAX_SECONDS = float(os.getenv("CHAT_LONG_POLL_MAX_SECONDS", "25"))
+
+# Keep stamped user_name values in sync when someone changes their name
+auth_storage.on_display_name_change(ChatDatabase.rename_author)
+
+
+class RoomWaiters:
+    """
+    Per-room asyncio.Condition for long-poll requests. A condition exists only
+    while someone is waiting on that room, so rooms nobody polls cost nothing.
+    notify() is called by ChatDatabase on the event loop.
+    """
+
+    def __init__(self):
+        self._conditions: Dict[str, asyncio.Condition] = {}
+        self._waiting: Dict[str, int] = {}
+
+    def waiter_count(self) -> int:
+        return sum(self._waiting.values())
+
+    async def wait_for(self, room_id: str, predicate: Callable[[], bool], timeout: float) -> bool:
+        """Waits until predicate() is true or timeout passes; returns the final predicate value."""
+        condition = self._conditions.get(room_id)
+        if condition is None:
+            condition = self._conditions[room_id] = asyncio.Condition()
+        self._waiting[room_id] = self._waiting.get(room_id, 0) + 1
+        try:
+            async with condition:
+                return await asyncio.wait_for(condition.wait_for(predicate), timeout)
+        except asyncio.TimeoutError:
+            return predicate()
+        finally:
+            self._waiting[room_id] -= 1
+            if not self._waiting[room_id]:
+                del self._waiting[room_id]
+                self._conditions.pop(room_id, None)
+
+    def notify(self, room_id: str) -> None:
+        if room_id in self._conditions:
+            asyncio.get_running_loop().create_task(self._notify_all(room_id))
+
+    async def _notify_all(self, room_id: str) -> None:
+        condition = self._conditions.get(room_id)
+        if condition is None:
+            return
+        async with condition:
+            condition.notify_all()
+
+
+waiters = RoomWaiters()
+ChatDatabase.on_change(waiters.notify)
+
+def _collect_waiter_metrics():
+    yield "chat_long_poll_waiters", "gauge", "Long-poll chat requests currently waiting.", {}, waiters.waiter_count()
+
+metrics.register_collector(_collect_waiter_metrics)
+
 class SendMessageRequest(BaseModel):
     room_id: str
     user_id: str
@@ -24,12 +88,16 @@ class SendMessageRequest(BaseModel):
 
 
 @router.post("/send")
-def send_message(req: SendMessageRequest):
+async def send_message(req: SendMessageRequest, request: Request):
+    # With an Idempotency-Key, a resend returns the first message instead of posting it twice
+    return await idempotency.run(request, "chat.send", req.model_dump(), lambda: _send_message(req), req.user_id)
+
+async def _send_message(req: SendMessageRequest):
     room = RoomDatabase.get_room(req.room_id)
     if not room:
         raise HTTPException(status_code=404, detail=f"Room {req.room_id} not found")
 
-    if req.user_id not in room.get("members", []):
+    if not RoomDatabase.is_member(req.room_id, req.user_id):
         raise HTTPException(status_code=403, detail="User not in room")
 
     content = req.content.strip()
@@ -40,19 +108,10 @@ def send_message(req: SendMessageRequest):
         message_obj = ChatDatabase.add_message(
             req.room_id,
             req.user_id,
-            content
+            content,
+            user_name=auth_storage.get_display_name(req.user_id)
         )
 
-        try:
-            user = auth_storage.get_user_by_id(req.user_id)
-            if user:
-                if isinstance(message_obj, dict):
-                    message_obj["user_name"] = user.get("name")
-                else:
-                    message_obj = {"message": message_obj, "user_name": user.get("name")}
-        except Exception:
-            pass
-
         return {"success": True, "message": message_obj}
 
     except ValueError as e:
@@ -60,49 +119,82 @@ def send_message(req: SendMessageRequest):
 
 
 @router.get("/{room_id}/messages")
-def get_messages(room_id: str, limit: Optional[int] = 50):
+@profiling.profiled("get_messages")
+async def get_messages(room_id: str, limit: Optional[int] = 50):
     room = RoomDatabase.get_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail=f"Room {room_id} not found")
 
+    # user_name is stamped on each message when it is written, so this is serialization only
     messages = ChatDatabase.get_messages(room_id, limit)
 
-    try:
-        uids = set()
-        for m in messages:
-            uid = None
-            if isinstance(m, dict):
-                uid = m.get("user_id") or m.get("userId") or m.get("user")
-            if uid:
-                uids.add(str(uid))
-
-        user_map: Dict[str, Optional[dict]] = {}
-        for uid in uids:
-            try:
-                user_map[uid] = auth_storage.get_user_by_id(uid)
-            except Exception:
-                user_map[uid] = None
-
-        for m in messages:
-            if not isinstance(m, dict):
-                continue
-            uid = m.get("user_id") or m.get("userId") or m.get("user")
-            if uid:
-                u = user_map.get(str(uid))
-                if u:
-                    m["user_name"] = u.get("name")
-    except Exception:
-        pass
+    return serialization.FastJSONResponse({
+        "success": True,
+        "room_id": room_id,
+        "messages": messages,
+        "cursor": ChatDatabase.latest_seq(room_id)
+    })
+
+
+@router.get("/{room_id}/poll")
+async def poll_messages(room_id: str, after: int = 0, timeout: float = CHAT_LONG_POLL_MAX_SECONDS, limit: int = 200):
+    """
+    Long-poll variant of /messages: returns as soon as there are messages with
+    seq > after, or an empty list once `timeout` seconds pass. The response
+    cursor goes into the next call's `after`. reset=true means the cursor was
+    stale (chat cleared, server restarted) and `messages` is the latest page
+    to replace, not append to, what the client shows.
+    """
+    if not RoomDatabase.get_room(room_id):
+        raise HTTPException(status_code=404, detail=f"Room {room_id} not found")
 
-    return {
+    def ready() -> bool:
+        # Any change to the room's chat (message, clear) moves latest_seq
+        return RoomDatabase.get_room(room_id) is None or ChatDatabase.latest_seq(room_id) != after
+
+    if not ready():
+        await waiters.wait_for(room_id, ready, max(0.0, min(timeout, CHAT_LONG_POLL_MAX_SECONDS)))
+
+    if not RoomDatabase.get_room(room_id):
+        raise HTTPException(status_code=404, detail=f"Room {room_id} not found")
+
+    cursor = ChatDatabase.latest_seq(room_id)
+    messages = ChatDatabase.get_messages_after(room_id, after, limit)
+    reset = messages is None
+    if reset:
+        messages = ChatDatabase.get_messages(room_id, limit)
+    elif messages:
+        cursor = messages[-1]["seq"]
+
+    return serialization.FastJSONResponse({
         "success": True,
         "room_id": room_id,
-        "messages": messages 
-    }
+        "messages": messages,
+        "cursor": cursor,
+        "reset": reset
+    })
+
+
+@router.get("/{room_id}/search")
+async def search_messages(room_id: str, q: str, offset: int = 0, limit: int = 20):
+    room = RoomDatabase.get_room(room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail=f"Room {room_id} not found")
+
+    offset = max(offset, 0)
+    limit = max(1, min(limit, 100))
+    total, hits = search.search_messages(room_id, q, offset, limit)
+    messages = []
+    for seq, score in hits:
+        msg = ChatDatabase.get_message(room_id, seq)
+        if msg is not None:
+            messages.append(dict(msg, score=score))
+
+    return {"success": True, "room_id": room_id, "query": q, "total": total, "offset": offset, "limit": limit, "messages": messages}
 
 
 @router.delete("/{room_id}/messages")
-def clear_messages(room_id: str, user_id: str):
+async def clear_messages(room_id: str, user_id: str):
     room = RoomDatabase.get_room(room_id)
     if not room:
         raise HTTPException(status_code=404, detail=f"Room {room_id} not found")
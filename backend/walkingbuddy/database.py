@@ -5,13 +5,69 @@ Sinthujan Jayaranjan
 This file handles the database for rooms and chat storage.
 """
 
-from typing import List, Dict, Optional 
+from typing import Callable, List, Dict, Optional 
 from datetime import datetime
+import time
 import uuid
 
+from backend import journal
+from . import search
+
+# Every store here is confined to the event loop: all handlers that touch it are
+# async, and nothing in this module awaits, so each call runs to completion
+# without interleaving and needs no locks. Don't call into it from a thread.
 ROOMS_DB: Dict[str, Dict] = {}
 CHAT_DB: Dict[str, List[Dict]] = {}
 
+# Membership is kept as insertion-ordered sets (dict keys) so checks are O(1);
+# room["members"] is a list snapshot that is replaced, never mutated, on change.
+ROOM_MEMBERS: Dict[str, Dict[str, None]] = {}
+# Reverse index: user_id -> rooms the user is a member of
+USER_ROOMS: Dict[str, Dict[str, None]] = {}
+
+# Wall-clock time of the last join/leave/message/status change, used by the sweeper
+ROOM_ACTIVITY: Dict[str, float] = {}
+
+# Last message seq handed out per room. Seqs keep counting across a clear (which
+# skips one), so a room's list always holds a contiguous seq range ending at CHAT_SEQ[room_id].
+CHAT_SEQ: Dict[str, int] = {}
+
+# callback(room_id) after a room's chat changes (message, clear, room deleted); runs on the event loop
+_CHAT_LISTENERS: List[Callable[[str], None]] = []
+
+def _notify_chat_change(room_id: str) -> None:
+  for callback in list(_CHAT_LISTENERS):
+    try:
+      callback(room_id)
+    except Exception:
+      pass
+
+def _touch(room_id: str) -> None:
+  ROOM_ACTIVITY[room_id] = time.time()
+
+# Bumped on every room change; lets callers cache anything derived from ROOMS_DB
+_generation = 0
+
+def _bump_generation() -> None:
+  global _generation
+  _generation += 1
+
+def _bump_version(room: Dict) -> None:
+  # Clients apply room deltas in version order and ask for a snapshot on a gap
+  room["version"] = room.get("version", 0) + 1
+  _bump_generation()
+
+def _index_member(room_id: str, user_id: str) -> None:
+  if user_id is not None:
+    USER_ROOMS.setdefault(user_id, {})[room_id] = None
+
+def _unindex_member(room_id: str, user_id: str) -> None:
+  rooms = USER_ROOMS.get(user_id)
+  if rooms is not None:
+    rooms.pop(room_id, None)
+    if not rooms:
+      USER_ROOMS.pop(user_id, None)
+
 class RoomDatabase:
   @staticmethod
   def create_room(
@@ -23,15 +79,13 @@ class RoomDatabase:
     max_members: int = 10,
     name: Optional[str] = None,
     meet_time: Optional[str] = None,
-    start_location: Optional[str] = None
+    start_location: Optional[str] = None,
+    creator_name: Optional[str] = None
   ) -> Dict:
-    if room_id in ROOMS_DB:
-      raise ValueError(f"Room {room_id} already exists")
-
     room = {
       "room_id": room_id,
       "creator_id": creator_id,
-      "creator_name": None,
+      "creator_name": creator_name,
       "name": name or destination,
       "destination": destination,
       "start_coord": start_coord,
@@ -41,13 +95,26 @@ class RoomDatabase:
       "max_members": max_members,
       "members": [creator_id],
       "created_at": datetime.utcnow().isoformat(),
-      "status": "active"
+      "status": "active",
+      "version": 1
     }
 
+    if room_id in ROOMS_DB:
+      raise ValueError(f"Room {room_id} already exists")
+    ROOM_MEMBERS[room_id] = {creator_id: None}
+    _index_member(room_id, creator_id)
     ROOMS_DB[room_id] = room
     CHAT_DB[room_id] = []
+    _bump_generation()
+    _touch(room_id)
+    journal.record("room.put", dict(room))
+    search.index_room(room)
     return room
 
+  @staticmethod
+  def generation() -> int:
+    return _generation
+
   @staticmethod
   def get_room(room_id: str) -> Optional[Dict]:
     return ROOMS_DB.get(room_id)
@@ -60,6 +127,16 @@ class RoomDatabase:
   def get_active_rooms() -> List[Dict]:
     return [room for room in ROOMS_DB.values() if room["status"] == "active"]
 
+  @staticmethod
+  def is_member(room_id: str, user_id: str) -> bool:
+    members = ROOM_MEMBERS.get(room_id)
+    return members is not None and user_id in members
+
+  @staticmethod
+  def get_user_rooms(user_id: str) -> List[Dict]:
+    room_ids = USER_ROOMS.get(user_id, {})
+    return [ROOMS_DB[rid] for rid in list(room_ids) if rid in ROOMS_DB]
+
   @staticmethod
   def join_room(room_id: str, user_id: str) -> Dict:
     room = ROOMS_DB.get(room_id)
@@ -67,13 +144,19 @@ class RoomDatabase:
     if not room:
       raise ValueError(f"Room {room_id} not found")
 
-    if user_id in room["members"]:
+    members = ROOM_MEMBERS[room_id]
+    if user_id in members:
       raise ValueError(f"User {user_id} already in room")
 
-    if len(room["members"]) >= room["max_members"]:
+    if len(members) >= room["max_members"]:
       raise ValueError(f"Room {room_id} is full")
 
-    room["members"].append(user_id)
+    members[user_id] = None
+    _index_member(room_id, user_id)
+    room["members"] = list(members)
+    _bump_version(room)
+    _touch(room_id)
+    journal.record("room.put", dict(room))
     return room
 
   @staticmethod
@@ -83,14 +166,20 @@ class RoomDatabase:
     if not room:
       raise ValueError(f"Room {room_id} not found")
 
-    if user_id not in room["members"]:
+    members = ROOM_MEMBERS[room_id]
+    if user_id not in members:
       raise ValueError(f"User {user_id} not found")
-      
-    room["members"].remove(user_id)
+        
+    del members[user_id]
+    _unindex_member(room_id, user_id)
+    room["members"] = list(members)
 
-    if len(room["members"]) == 0:
+    if len(members) == 0:
       room["status"] = "complete"
-    
+    _bump_version(room)
+    _touch(room_id)
+    journal.record("room.put", dict(room))
+      
     return room
 
   @staticmethod
@@ -101,32 +190,111 @@ class RoomDatabase:
       raise ValueError(f"Room {room_id} not found")
 
     room["status"] = status
+    _bump_version(room)
+    _touch(room_id)
+    journal.record("room.put", dict(room))
     return room
     
+  @staticmethod
+  def rename_creator(user_id: str, name: str) -> List[Dict]:
+    # creator_name is stamped at write time, so it has to be refreshed on a rename.
+    # Returns the renamed rooms so the caller can send their (version-bumped) deltas
+    renamed = []
+    for room in ROOMS_DB.values():
+      if room["creator_id"] == user_id:
+        room["creator_name"] = name
+        _bump_version(room)
+        journal.record("room.put", dict(room))
+        renamed.append(room)
+    return renamed
+
+  @staticmethod
+  def load_room(room: Dict, activity: Optional[float] = None) -> None:
+    # Restores a room from a snapshot or journal replay; rebuilds the membership indexes
+    room_id = room["room_id"]
+    for user_id in ROOM_MEMBERS.get(room_id, {}):
+      _unindex_member(room_id, user_id)
+    ROOM_MEMBERS[room_id] = dict.fromkeys(room["members"])
+    for user_id in room["members"]:
+      _index_member(room_id, user_id)
+    ROOMS_DB[room_id] = room
+    CHAT_DB.setdefault(room_id, [])
+    _bump_generation()
+    ROOM_ACTIVITY[room_id] = activity or time.time()
+
+  @staticmethod
+  def reindex(room_id: str) -> None:
+    # Restore loads rooms and messages without indexing them (faster cold start);
+    # startup warming calls this per room afterwards
+    room = ROOMS_DB.get(room_id)
+    if room is None:
+      return
+    search.index_room(room)
+    search.drop_messages(room_id)
+    for msg in CHAT_DB.get(room_id, []):
+      search.index_message(room_id, msg)
+
   @staticmethod
   def delete_room(room_id: str) -> Dict:
     room = ROOMS_DB.get(room_id)
     if not room:
       raise ValueError(f"Room {room_id} not found")
     removed = ROOMS_DB.pop(room_id)
+    _bump_generation()
+    for user_id in ROOM_MEMBERS.pop(room_id, {}):
+      _unindex_member(room_id, user_id)
+    ROOM_ACTIVITY.pop(room_id, None)
     if room_id in CHAT_DB:
       CHAT_DB.pop(room_id, None)
+    CHAT_SEQ.pop(room_id, None)
+    search.unindex_room(room_id)
+    journal.record("room.del", room_id)
+    _notify_chat_change(room_id)
     return removed
 
 class ChatDatabase:
   @staticmethod
-  def add_message(room_id: str, user_id: str, message:  str) -> Dict:
-    if room_id not in CHAT_DB:
-      raise ValueError(f"Room {room_id} not found")
+  def on_change(callback: Callable[[str], None]) -> None:
+    _CHAT_LISTENERS.append(callback)
 
+  @staticmethod
+  def add_message(room_id: str, user_id: str, message:  str, user_name: Optional[str] = None) -> Dict:
     msg = {
       "user_id": user_id,
       "message": message,
-      "timestamp": datetime.utcnow().isoformat()
+      "timestamp": datetime.utcnow().isoformat(),
+      "user_name": user_name
     }
-    CHAT_DB[room_id].append(msg)
+    messages = CHAT_DB.get(room_id)
+    if messages is None:
+      raise ValueError(f"Room {room_id} not found")
+    msg["seq"] = CHAT_SEQ.get(room_id, 0) + 1
+    messages.append(msg)
+    CHAT_SEQ[room_id] = msg["seq"]
+    _touch(room_id)
+    journal.record("chat.append", room_id, len(messages) - 1, msg)
+    search.index_message(room_id, msg)
+    _notify_chat_change(room_id)
     return msg
 
+  @staticmethod
+  def load_message(room_id: str, index: int, msg: Dict) -> None:
+    # Journal replay: the index makes re-applying an append already in the snapshot a no-op
+    messages = CHAT_DB.get(room_id)
+    if messages is None or index < len(messages):
+      return
+    msg.setdefault("seq", CHAT_SEQ.get(room_id, 0) + 1)
+    messages.append(msg)
+    CHAT_SEQ[room_id] = msg["seq"]
+
+  @staticmethod
+  def load_history(room_id: str, messages: List[Dict]) -> None:
+    # Snapshot restore; messages written before seqs existed are numbered in order
+    for i, msg in enumerate(messages, start=1):
+      msg.setdefault("seq", i)
+    CHAT_DB[room_id] = messages
+    CHAT_SEQ[room_id] = messages[-1]["seq"] if messages else 0
+
   @staticmethod
   def get_messages(room_id: str, limit: Optional[int] = None) -> List[Dict]:
     messages = CHAT_DB.get(room_id, [])
@@ -135,10 +303,58 @@ class ChatDatabase:
       return messages[-limit:]
     return messages
 
+  @staticmethod
+  def get_message(room_id: str, seq: int) -> Optional[Dict]:
+    messages = CHAT_DB.get(room_id)
+    if not messages:
+      return None
+    i = seq - messages[0]["seq"]
+    return messages[i] if 0 <= i < len(messages) else None
+
+  @staticmethod
+  def latest_seq(room_id: str) -> int:
+    return CHAT_SEQ.get(room_id, 0)
+
+  @staticmethod
+  def get_messages_after(room_id: str, after_seq: int, limit: Optional[int] = None) -> Optional[List[Dict]]:
+    """
+    Messages with seq > after_seq, oldest first. Returns None when the cursor
+    is no longer valid (chat cleared past it, or ahead of the room after a
+    restart) and the caller should reload instead of appending.
+    """
+    messages = CHAT_DB.get(room_id, [])
+    latest = CHAT_SEQ.get(room_id, 0)
+    base = messages[0]["seq"] - 1 if messages else latest
+    if after_seq < base or after_seq > latest:
+      return None
+    start = after_seq - base
+    if limit:
+      return messages[start:start + limit]
+    return messages[start:]
+
+  @staticmethod
+  def rename_author(user_id: str, name: str) -> int:
+    # user_name is stamped at write time, so it has to be refreshed on a rename.
+    # Renamed messages are replaced, not mutated: a snapshot in progress shares the old dicts
+    count = 0
+    for messages in CHAT_DB.values():
+      for i, msg in enumerate(messages):
+        if msg["user_id"] == user_id:
+          messages[i] = {**msg, "user_name": name}
+          count += 1
+    if count:
+      journal.record("chat.rename", user_id, name)
+    return count
+
   @staticmethod
   def clear_room_chat(room_id: str) -> bool:
-    if room_id in CHAT_DB:
-      CHAT_DB[room_id] = []
-      return True
-    return False
+    if room_id not in CHAT_DB:
+      return False
+    CHAT_DB[room_id] = []
+    # Skip a seq so every cursor handed out before the clear reads as stale
+    CHAT_SEQ[room_id] = CHAT_SEQ.get(room_id, 0) + 1
+    journal.record("chat.clear", room_id)
+    search.drop_messages(room_id)
+    _notify_chat_change(room_id)
+    return True
     
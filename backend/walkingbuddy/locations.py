@@ -0,0 +1,260 @@
+"""
+locations.py
+
+Live location sharing for room members over the rooms WebSocket.
+
+Members send {"op": "location:update", ...} as often as their device reports a
+fix; only the latest position per member is kept. Fan-out is coalesced: a
+single ticker wakes LOCATION_TICK_HZ times a second and, for each room that
+changed since the last tick, sends one "location:tick" frame with every
+position that changed (and every member whose position expired) to that
+room's subscribers. A group of N members updating once a second therefore
+costs N frames per tick instead of N^2 per round of updates, and idle rooms
+cost nothing.
+
+Positions older than LOCATION_STALE_SECONDS are dropped and reported in the
+next tick's "expired" list, so a member who closes the app disappears from
+the map without having to say so. A subscriber that doesn't take its frame
+within LOCATION_SEND_TIMEOUT is dropped from every stream rather than holding
+up the tick for everyone else. It is then sent (best effort, off the tick) a
+"location:unsubscribed" frame naming those rooms, so the client knows to
+subscribe again.
+
+Everything here runs on the event loop, so there is no locking.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from backend import metrics, serialization
+
+logger = logging.getLogger(__name__)
+
+LOCATION_TICK_HZ = float(os.getenv("LOCATION_TICK_HZ", "1"))
+LOCATION_STALE_SECONDS = float(os.getenv("LOCATION_STALE_SECONDS", "30"))
+# Per-socket budget for one tick frame; kept under the tick interval so a socket
+# stuck on backpressure can't hold up the tick for every other room
+LOCATION_SEND_TIMEOUT = min(
+    float(os.getenv("LOCATION_SEND_TIMEOUT", str(0.5 / LOCATION_TICK_HZ))),
+    0.9 / LOCATION_TICK_HZ,
+)
+
+location_send_timeouts_total = metrics.Counter(
+    "location_send_timeouts_total", "Location subscribers dropped for not taking a tick frame in time.",
+)
+
+# Optional numeric fields passed through from the client's fix
+_OPTIONAL_FIELDS = ("accuracy", "heading", "speed")
+
+
+def _number(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_position(msg: Dict) -> Optional[Dict]:
+    """
+    Validates a location:update frame. Returns the stored position (without
+    user_id/ts) or None if lat/lon are missing or out of range.
+    """
+    lat = _number(msg.get("lat"))
+    lon = _number(msg.get("lon"))
+    if lat is None or lon is None or not (-90.0 <= lat <= 90.0) or not (-180.0 <= lon <= 180.0):
+        return None
+    position = {"lat": round(lat, 6), "lon": round(lon, 6)}
+    for field in _OPTIONAL_FIELDS:
+        value = _number(msg.get(field))
+        if value is not None:
+            position[field] = round(value, 2)
+    return position
+
+
+class _RoomLocations:
+    __slots__ = ("positions", "changed", "expired", "subscribers")
+
+    def __init__(self):
+        self.positions: Dict[str, Dict] = {}
+        # Members whose position changed / expired since the last tick
+        self.changed: Set[str] = set()
+        self.expired: Set[str] = set()
+        # socket -> the member it was subscribed as, so leaving the room also ends the stream
+        self.subscribers: Dict[object, str] = {}
+
+
+class LocationHub:
+    def __init__(self):
+        self._rooms: Dict[str, _RoomLocations] = {}
+        # socket -> rooms it subscribed to, so a disconnect can clean up
+        self._socket_rooms: Dict[object, Set[str]] = {}
+        # Pending "location:unsubscribed" notices, held so they aren't garbage collected
+        self._notices: Set[asyncio.Task] = set()
+
+    def _room(self, room_id: str) -> _RoomLocations:
+        state = self._rooms.get(room_id)
+        if state is None:
+            state = self._rooms[room_id] = _RoomLocations()
+        return state
+
+    @property
+    def room_count(self) -> int:
+        return len(self._rooms)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._socket_rooms)
+
+    def subscribe(self, websocket, room_id: str, user_id: str) -> Dict:
+        """
+        Adds the socket to the room's stream on behalf of member user_id and
+        returns a "location:snapshot" frame with every current position.
+        """
+        state = self._room(room_id)
+        state.subscribers[websocket] = user_id
+        self._socket_rooms.setdefault(websocket, set()).add(room_id)
+        cutoff = time.time() - LOCATION_STALE_SECONDS
+        positions = [p for p in state.positions.values() if p["ts"] >= cutoff]
+        return {"type": "location:snapshot", "room_id": room_id, "positions": positions}
+
+    def unsubscribe(self, websocket, room_id: str) -> None:
+        state = self._rooms.get(room_id)
+        if state is not None:
+            state.subscribers.pop(websocket, None)
+        self._forget(websocket, room_id)
+
+    def _forget(self, websocket, room_id: str) -> None:
+        rooms = self._socket_rooms.get(websocket)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._socket_rooms[websocket]
+
+    def disconnect(self, websocket) -> List[str]:
+        """Drops the socket from every stream; returns the rooms it was subscribed to."""
+        rooms = list(self._socket_rooms.pop(websocket, ()))
+        for room_id in rooms:
+            state = self._rooms.get(room_id)
+            if state is not None:
+                state.subscribers.pop(websocket, None)
+        return rooms
+
+    def update(self, room_id: str, user_id: str, position: Dict) -> None:
+        """Records a member's latest position; it goes out on the next tick."""
+        position["user_id"] = user_id
+        position["ts"] = round(time.time(), 3)
+        state = self._room(room_id)
+        state.positions[user_id] = position
+        state.changed.add(user_id)
+        state.expired.discard(user_id)
+
+    def remove_member(self, room_id: str, user_id: str) -> None:
+        """
+        Drops a member who left: the other subscribers see their position
+        expire, and their own sockets stop receiving the room's positions.
+        """
+        state = self._rooms.get(room_id)
+        if state is None:
+            return
+        if state.positions.pop(user_id, None) is not None:
+            state.changed.discard(user_id)
+            state.expired.add(user_id)
+        for websocket in [ws for ws, member in state.subscribers.items() if member == user_id]:
+            del state.subscribers[websocket]
+            self._forget(websocket, room_id)
+
+    def drop_room(self, room_id: str) -> None:
+        state = self._rooms.pop(room_id, None)
+        if state is None:
+            return
+        for websocket in state.subscribers:
+            self._forget(websocket, room_id)
+
+    def collect_tick(self, now: Optional[float] = None) -> List[Tuple[List, Dict]]:
+        """
+        Expires stale positions and drains pending changes.
+
+        Returns:
+            (subscribers, "location:tick" frame) for every room with something to send
+        """
+        cutoff = (time.time() if now is None else now) - LOCATION_STALE_SECONDS
+        frames = []
+        for room_id in list(self._rooms):
+            state = self._rooms[room_id]
+            for user_id, position in list(state.positions.items()):
+                if position["ts"] < cutoff:
+                    del state.positions[user_id]
+                    state.changed.discard(user_id)
+                    state.expired.add(user_id)
+            if state.changed or state.expired:
+                if state.subscribers:
+                    frames.append((list(state.subscribers), {
+                        "type": "location:tick",
+                        "room_id": room_id,
+                        "positions": [state.positions[user_id] for user_id in state.changed],
+                        "expired": list(state.expired),
+                    }))
+                state.changed = set()
+                state.expired = set()
+            elif not state.positions and not state.subscribers:
+                del self._rooms[room_id]
+        return frames
+
+    async def run(self, send: Callable[[object, str], Awaitable[None]]) -> None:
+        interval = 1.0 / LOCATION_TICK_HZ
+        logger.info("Location ticker started (%.1f Hz, stale after %ss)", LOCATION_TICK_HZ, LOCATION_STALE_SECONDS)
+        while True:
+            started = time.perf_counter()
+            try:
+                await self._send_frames(send)
+            except Exception:
+                logger.exception("Location tick failed")
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+
+    async def _send_frames(self, send: Callable[[object, str], Awaitable[None]]) -> None:
+        frames = self.collect_tick()
+        if not frames:
+            return
+        start = time.perf_counter()
+        sockets = []
+        coros = []
+        for subscribers, frame in frames:
+            # Serialized once per room, not once per recipient
+            text = serialization.dumps_text(frame)
+            sockets.extend(subscribers)
+            coros.extend(asyncio.wait_for(send(websocket, text), LOCATION_SEND_TIMEOUT) for websocket in subscribers)
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        for websocket, result in zip(sockets, results):
+            if isinstance(result, Exception):
+                rooms = self.disconnect(websocket)
+                if isinstance(result, asyncio.TimeoutError) and rooms:
+                    location_send_timeouts_total.inc()
+                    task = asyncio.ensure_future(self._notify_dropped(send, websocket, rooms))
+                    self._notices.add(task)
+                    task.add_done_callback(self._notices.discard)
+        metrics.websocket_broadcast_seconds.observe(time.perf_counter() - start, "locations")
+        metrics.websocket_broadcast_recipients.observe(len(sockets), "locations")
+
+    async def _notify_dropped(self, send: Callable[[object, str], Awaitable[None]], websocket, rooms: List[str]) -> None:
+        # The socket was slow, not necessarily gone: give the notice until a position would go stale
+        frame = {"type": "location:unsubscribed", "room_ids": rooms, "reason": "slow_consumer"}
+        try:
+            await asyncio.wait_for(send(websocket, serialization.dumps_text(frame)), LOCATION_STALE_SECONDS)
+        except Exception:
+            logger.debug("Could not tell a dropped location subscriber", exc_info=True)
+
+
+hub = LocationHub()
+
+
+def _collect_location_metrics():
+    yield "location_rooms", "gauge", "Rooms with live location state.", {}, hub.room_count
+    yield "location_subscribers", "gauge", "Sockets subscribed to at least one location stream.", {}, hub.subscriber_count
+
+
+metrics.register_collector(_collect_location_metrics)
@@ -5,19 +5,27 @@ Sinthujan Jayaranjan
 This file handles all the room-related operations which include:
 - Creating new walking rooms
 - Listing available rooms
+- Searching rooms by name, destination and start location
 - Joining existing rooms
 - Updating room status
+- Live location sharing between members (over the rooms WebSocket)
 """
 
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Request
 from pydantic import BaseModel
 from typing import List, Optional
 import uuid
+import time
 import asyncio
 import json
-from backend.auth import auth_storage
+from backend import serialization, metrics, profiling, idempotency
+from backend.compression import mark_cacheable
+from backend.auth import auth_storage, session_tokens
 
 from .database import RoomDatabase
+from .sweeper import sweeper, RoomEvents
+from .locations import hub as locations, parse_position
+from . import search
 
 import logging
 logger = logging.getLogger(__name__)
@@ -38,15 +46,31 @@ class ConnectionManager:
         except ValueError:
             pass
 
+    async def send_to(self, websocket: WebSocket, message: dict):
+        try:
+            await websocket.send_text(serialization.dumps_text(message))
+        except Exception:
+            self.disconnect(websocket)
+
+    @profiling.profiled("broadcast")
     async def broadcast(self, message: dict):
         if not self.active_connections:
             return
-        text = json.dumps(message)
-        coros = [ws.send_text(text) for ws in list(self.active_connections)]
+        start = time.perf_counter()
+        text = serialization.dumps_text(message)
+        sockets = list(self.active_connections)
+        coros = [ws.send_text(text) for ws in sockets]
         await asyncio.gather(*coros, return_exceptions=True)
+        metrics.websocket_broadcast_seconds.observe(time.perf_counter() - start, "rooms")
+        metrics.websocket_broadcast_recipients.observe(len(sockets), "rooms")
 
 manager = ConnectionManager()
 
+def _collect_socket_metrics():
+    yield "websocket_connections", "gauge", "Open WebSocket connections.", {"channel": "rooms"}, len(manager.active_connections)
+
+metrics.register_collector(_collect_socket_metrics)
+
 class CreateRoomRequest(BaseModel):
     user_id: Optional[str] = None
     destination: str
@@ -72,27 +96,6 @@ class UpdateRoomStatusRequest(BaseModel):
     room_id: str
     status: str
 
-def attach_creator_name(room: dict) -> dict:
-    """
-    Mutates (and returns) room dict to include 'creator_name' if possible.
-    Uses auth_storage.get_user_by_id(...) which returns minimal public user info.
-    """
-    if not isinstance(room, dict):
-        return room
-    creator_id = room.get("creator_id") or room.get("creatorId") or room.get("creator") or room.get("user_id")
-    if not creator_id:
-        room["creator_name"] = room.get("creator_name") or None
-        return room
-    try:
-        user = auth_storage.get_user_by_id(str(creator_id))
-    except Exception:
-        user = None
-    if user:
-        room["creator_name"] = user.get("name")
-    else:
-        room["creator_name"] = room.get("creator_name") or None
-    return room
-
 def attach_canonical_ids(room: dict, prefer_room_id: Optional[str] = None) -> dict:
     if not isinstance(room, dict):
         return room
@@ -111,24 +114,100 @@ def attach_canonical_ids(room: dict, prefer_room_id: Optional[str] = None) -> di
     room["uuid"] = rid
     return room
 
-async def emit_room_event(event_type: str, room: dict):
-    attach_creator_name(room)
+def room_event_payload(event_type: str, room: dict) -> dict:
+    """
+    Full-room event; only used for room:new and snapshot replies.
+    """
     attach_canonical_ids(room)
-    payload = {
+    return {
         "type": event_type,
         "room": room,
         "room_id": room.get("room_id"),
     }
-    await manager.broadcast(payload)
+
+def room_delta_payload(op: str, room: dict, **fields) -> dict:
+    """
+    Compact per-room delta, e.g. {op: "member_added", room_id, user_id, version}.
+    Clients apply deltas in version order and request a snapshot on a gap.
+    """
+    payload = {"type": "room:delta", "op": op, "room_id": room["room_id"], "version": room.get("version")}
+    payload.update(fields)
+    return payload
+
+def room_delete_payload(room_id: str) -> dict:
+    return {"type": "room:delete", "room_id": room_id}
+
+async def emit_room_event(event_type: str, room: dict):
+    await manager.broadcast(room_event_payload(event_type, room))
+
+async def emit_room_delta(op: str, room: dict, **fields):
+    await manager.broadcast(room_delta_payload(op, room, **fields))
+
+def rename_creator(user_id: str, name: str) -> None:
+    """
+    Refreshes the stamped creator_name on the user's rooms. Each rename bumps
+    the room's version, so the matching "creator_name" deltas go out (as one
+    batch) to keep clients from seeing a version gap.
+    """
+    rooms = RoomDatabase.rename_creator(user_id, name)
+    if not rooms:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return  # renamed outside the server (e.g. a script); nobody is connected
+    events = [room_delta_payload("creator_name", room, creator_name=name) for room in rooms]
+    loop.create_task(manager.broadcast({"type": "room:batch", "events": events}))
+
+# Keep stamped creator_name values in sync when someone changes their name
+auth_storage.on_display_name_change(rename_creator)
+
+async def emit_room_events(events: RoomEvents):
+    """
+    Sends several room events as one "room:batch" frame (used by the sweeper).
+    """
+    if not events:
+        return
+    payloads = []
+    for event_type, room in events:
+        if event_type == "room:delete":
+            locations.drop_room(room["room_id"])
+            payloads.append(room_delete_payload(room["room_id"]))
+        else:
+            payloads.append(room_delta_payload("status", room, status=room.get("status")))
+    await manager.broadcast({"type": "room:batch", "events": payloads})
+
+def start_room_sweeper() -> asyncio.Task:
+    for room in RoomDatabase.get_all_rooms():
+        sweeper.track(room)
+    return asyncio.create_task(sweeper.run(emit_room_events))
+
+def start_location_ticker() -> asyncio.Task:
+    async def send(websocket: WebSocket, text: str):
+        await websocket.send_text(text)
+    return asyncio.create_task(locations.run(send))
 
 @router.post("/create")
 async def create_room(req: CreateRoomRequest, request: Request):
+    # With an Idempotency-Key, a retried create returns the first room instead of making another
+    return await idempotency.run(request, "rooms.create", req.model_dump(), lambda: _create_room(req, request), req.user_id)
+
+async def _create_room(req: CreateRoomRequest, request: Request):
     try:
         room_id = str(uuid.uuid4())[:8]
         name = req.room_name or req.name
         meet = req.meet_time or getattr(req, "meetTime", None)
         start_loc = req.start_location or getattr(req, "startLocation", None)
 
+        # creator_name is stamped once here so reads never need a user lookup
+        creator_name = None
+        try:
+            creator_name = (request.session.get("user_name") or request.session.get("name") or None)
+        except Exception:
+            pass
+        if not creator_name and req.user_id:
+            creator_name = auth_storage.get_display_name(str(req.user_id))
+
         room = RoomDatabase.create_room(
             room_id=room_id,
             creator_id=req.user_id,
@@ -138,18 +217,10 @@ async def create_room(req: CreateRoomRequest, request: Request):
             max_members=req.max_members,
             name=name,
             meet_time=meet,
-            start_location=start_loc
+            start_location=start_loc,
+            creator_name=creator_name
         )
-        try:
-            session_name = (request.session.get("user_name") or request.session.get("name") or None)
-            if session_name:
-                room["creator_name"] = session_name
-        except Exception:
-            pass
-        try:
-            attach_creator_name(room)
-        except Exception:
-            logger.exception("[rooms.create] attach_creator_name failed for %s", room_id)
+        sweeper.track(room)
         try:
             await emit_room_event("room:new", room)
         except Exception:
@@ -163,18 +234,84 @@ async def create_room(req: CreateRoomRequest, request: Request):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Internal server error")
         
+# (room generation, encoded body) for /list; rebuilt only after a room changes
+_room_list_cache = (-1, b"")
+
 @router.get("/list")
-def list_rooms():
-    rooms = RoomDatabase.get_active_rooms()
-    enriched = [attach_canonical_ids(attach_creator_name(dict(r))) for r in rooms]
-    return {"success": True, "rooms": enriched}
+@profiling.profiled("list_rooms")
+async def list_rooms(request: Request):
+    mark_cacheable(request, ("rooms.list", RoomDatabase.generation()))
+    return serialization.PreEncodedJSONResponse(room_list_body())
+
+def room_list_body() -> bytes:
+    """Encoded /list body, rebuilt only when the room generation moved."""
+    global _room_list_cache
+    generation = RoomDatabase.generation()
+    cached_generation, body = _room_list_cache
+    metrics.cache_requests_total.inc("room_list", "hit" if cached_generation == generation else "miss")
+    if cached_generation != generation:
+        enriched = [attach_canonical_ids(dict(r)) for r in RoomDatabase.get_active_rooms()]
+        body = serialization.dumps({"success": True, "rooms": enriched})
+        _room_list_cache = (generation, body)
+    return body
+
+async def warm_caches(batch: int = 200) -> None:
+    """
+    Post-startup warming: builds the search indexes for restored rooms (a
+    batch at a time so requests are served in between) and the /list body.
+    """
+    for i, room_id in enumerate([r["room_id"] for r in RoomDatabase.get_all_rooms()]):
+        RoomDatabase.reindex(room_id)
+        if i % batch == batch - 1:
+            await asyncio.sleep(0)
+    room_list_body()
+
+@router.get("/search")
+async def search_rooms(q: str, offset: int = 0, limit: int = 20, include_inactive: bool = False):
+    """
+    Ranked, paginated room search over name, destination and start_location.
+    The last word may be partial ("main lib" matches "Main Library").
+    """
+    offset = max(offset, 0)
+    limit = max(1, min(limit, 100))
+
+    def accept(room_id):
+        room = RoomDatabase.get_room(room_id)
+        return room is not None and (include_inactive or room["status"] == "active")
+
+    total, hits = search.search_rooms(q, offset, limit, accept)
+    rooms = []
+    for room_id, score in hits:
+        room = RoomDatabase.get_room(room_id)
+        if room is not None:
+            rooms.append(dict(attach_canonical_ids(dict(room)), score=score))
+    return {"success": True, "query": q, "total": total, "offset": offset, "limit": limit, "rooms": rooms}
+
+@router.get("/mine")
+async def list_my_rooms(request: Request, user_id: Optional[str] = None):
+    # Same fallback order as join/leave: session first, then ?user_id= for debugging
+    auth_user = None
+    try:
+        auth_user = session_tokens.get_session_user_id_optional(request)
+    except Exception:
+        auth_user = None
+    auth_user = auth_user or user_id
+    if not auth_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    rooms = [attach_canonical_ids(dict(r)) for r in RoomDatabase.get_user_rooms(str(auth_user))]
+    return {"success": True, "rooms": rooms}
 
 @router.post("/join")
 async def join_room(req: JoinRoomRequest, request: Request):
+    # With an Idempotency-Key, a retried join gets the first success back (no "already in room", no second broadcast)
+    return await idempotency.run(request, "rooms.join", req.model_dump(), lambda: _join_room(req, request), req.user_id)
+
+async def _join_room(req: JoinRoomRequest, request: Request):
     # Prefer the session user id; fall back to the body or query param (useful for debugging).
     user_id = None
     try:
-        user_id = request.session.get("user_id")
+        user_id = session_tokens.get_session_user_id_optional(request)
     except Exception:
         user_id = None
 
@@ -189,9 +326,8 @@ async def join_room(req: JoinRoomRequest, request: Request):
     try:
         # Ensure we pass the resolved user_id to the DB call
         room = RoomDatabase.join_room(req.room_id, str(user_id))
-        attach_creator_name(room)
         attach_canonical_ids(room)
-        await emit_room_event("room:join", room)
+        await emit_room_delta("member_added", room, user_id=str(user_id))
         return {
             "success": True,
             "room": room,
@@ -211,7 +347,7 @@ async def join_room(req: JoinRoomRequest, request: Request):
 async def leave_room(req: LeaveRoomRequest, request: Request):
     user_id = None
     try:
-        user_id = request.session.get("user_id")
+        user_id = session_tokens.get_session_user_id_optional(request)
     except Exception:
         user_id = None
 
@@ -224,9 +360,10 @@ async def leave_room(req: LeaveRoomRequest, request: Request):
 
     try:
         room = RoomDatabase.leave_room(req.room_id, str(user_id))
-        attach_creator_name(room)
+        sweeper.track(room)
+        locations.remove_member(req.room_id, str(user_id))
         attach_canonical_ids(room)
-        await emit_room_event("room:leave", room)
+        await emit_room_delta("member_removed", room, user_id=str(user_id), status=room.get("status"))
         return {
             "success": True,
             "room": room,
@@ -245,7 +382,8 @@ async def leave_room(req: LeaveRoomRequest, request: Request):
 async def delete_room(room_id: str, request: Request, user_id: Optional[str] = None):
     session_user = None
     try:
-        session_user = request.session.get("user_id") or request.session.get("id") or request.session.get("userId")
+        session_user = (session_tokens.get_session_user_id_optional(request)
+                        or request.session.get("id") or request.session.get("userId"))
     except Exception:
         session_user = None
 
@@ -281,7 +419,8 @@ async def delete_room(room_id: str, request: Request, user_id: Optional[str] = N
 
     try:
         removed = RoomDatabase.delete_room(room_id)
-        await emit_room_event("room:delete", {"room_id": room_id})
+        locations.drop_room(room_id)
+        await manager.broadcast(room_delete_payload(room_id))
         logger.info("[rooms.delete] deleted room %s by user %s", room_id, auth_user)
         return {"success": True, "message": f"Room {room_id} deleted.", "room": removed}
     except ValueError as e:
@@ -295,9 +434,9 @@ async def delete_room(room_id: str, request: Request, user_id: Optional[str] = N
 async def update_room_status(req: UpdateRoomStatusRequest):
     try:
         room = RoomDatabase.update_room_status(req.room_id, req.status)
-        attach_creator_name(room)
+        sweeper.track(room)
         attach_canonical_ids(room)
-        await emit_room_event("room:update", room)
+        await emit_room_delta("status", room, status=room.get("status"))
         return {
             "success": True,
             "room": room,
@@ -306,13 +445,70 @@ async def update_room_status(req: UpdateRoomStatusRequest):
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+async def handle_socket_message(websocket: WebSocket, text: str):
+    """
+    Client -> server frames. {"op": "snapshot", "room_id": ...} asks for the
+    full room after the client detected a gap in delta versions.
+
+    Location sharing (signed-in members only; see locations.py):
+    {"op": "location:subscribe", "room_id": ...} -> "location:snapshot", then "location:tick" frames
+    {"op": "location:update", "room_id": ..., "lat": ..., "lon": ..., "accuracy"?, "heading"?, "speed"?}
+    {"op": "location:unsubscribe", "room_id": ...}
+    A subscriber too slow to take its ticks gets {"type": "location:unsubscribed", "room_ids": [...]}
+    and has to subscribe again.
+    """
+    try:
+        msg = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(msg, dict):
+        return
+    op = msg.get("op")
+    if op == "snapshot":
+        room_id = str(msg.get("room_id") or "")
+        room = RoomDatabase.get_room(room_id)
+        if room is None:
+            await manager.send_to(websocket, room_delete_payload(room_id))
+        else:
+            await manager.send_to(websocket, room_event_payload("room:snapshot", dict(room)))
+    elif op in ("location:subscribe", "location:update"):
+        room_id = str(msg.get("room_id") or "")
+        user_id = socket_user_id(websocket)
+        if not user_id:
+            await manager.send_to(websocket, {"type": "location:error", "room_id": room_id, "error": "Authentication required"})
+            return
+        if not RoomDatabase.is_member(room_id, user_id):
+            await manager.send_to(websocket, {"type": "location:error", "room_id": room_id, "error": "Not a member of this room"})
+            return
+        if op == "location:subscribe":
+            await manager.send_to(websocket, locations.subscribe(websocket, room_id, user_id))
+        else:
+            position = parse_position(msg)
+            if position is not None:
+                locations.update(room_id, user_id, position)
+    elif op == "location:unsubscribe":
+        locations.unsubscribe(websocket, str(msg.get("room_id") or ""))
+
+def socket_user_id(websocket: WebSocket) -> Optional[str]:
+    # Session or claim only: unlike the HTTP routes there is no user_id fallback,
+    # since that would let anyone who knows a member's id read or spoof live positions
+    try:
+        user_id = session_tokens.get_session_user_id_optional(websocket)
+    except Exception:
+        user_id = None
+    return str(user_id) if user_id else None
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            await handle_socket_message(websocket, text)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception:
+        logger.debug("rooms socket closed with an error", exc_info=True)
+    finally:
         manager.disconnect(websocket)
+        locations.disconnect(websocket)
@@ -0,0 +1,197 @@
+"""
+search.py
+
+In-memory inverted indexes for room and chat search.
+
+database.py keeps them in step with the stores: rooms are indexed on create
+and removed on delete, and each room's messages get their own index (built
+on add_message, dropped on clear/delete) so chat search is always scoped to
+one room. Queries AND their terms together. The last term also matches as a
+prefix, for search-as-you-type ("main libr" finds "Main Library"), scored
+lower than an exact hit. Results are ranked by field-weighted tf-idf, newest
+first on ties.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# A prefix expands to at most this many terms (the shortest, i.e. closest to what was typed)
+MAX_PREFIX_EXPANSIONS = 16
+MIN_PREFIX_LENGTH = 2
+PREFIX_MATCH_WEIGHT = 0.5
+
+ROOM_FIELD_WEIGHTS = {"name": 3.0, "destination": 2.0, "start_location": 1.0}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    # Fold accents so "Café" and "cafe" match
+    folded = unicodedata.normalize("NFKD", str(text).lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(folded)
+
+
+class InvertedIndex:
+    """
+    token -> {doc_id: weight} postings plus a sorted vocabulary for prefix
+    lookups. Event-loop only, like the stores in database.py; no locking.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Hashable, float]] = {}
+        self._doc_terms: Dict[Hashable, Dict[str, float]] = {}
+        # Insertion order breaks score ties (newer first)
+        self._doc_order: Dict[Hashable, int] = {}
+        self._vocab: List[str] = []
+        self._counter = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: Hashable, fields: Dict[str, Tuple[Optional[str], float]]) -> None:
+        """
+        Indexes (or re-indexes) a document. fields maps name -> (text, weight).
+        """
+        terms: Dict[str, float] = {}
+        for text, weight in fields.values():
+            for token in tokenize(text):
+                terms[token] = terms.get(token, 0.0) + weight
+        self.remove(doc_id)
+        self._counter += 1
+        self._doc_order[doc_id] = self._counter
+        self._doc_terms[doc_id] = terms
+        for token, weight in terms.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._vocab, token)
+            posting[doc_id] = weight
+
+    def remove(self, doc_id: Hashable) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._doc_order.pop(doc_id, None)
+        for token in terms:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocab, token)
+                if i < len(self._vocab) and self._vocab[i] == token:
+                    del self._vocab[i]
+
+    def _expand(self, term: str) -> List[str]:
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocab, term)
+        end = bisect.bisect_left(self._vocab, term + "\uffff", start)
+        tokens = self._vocab[start:end]
+        if len(tokens) > MAX_PREFIX_EXPANSIONS:
+            tokens = heapq.nsmallest(MAX_PREFIX_EXPANSIONS, tokens, key=len)
+        return tokens
+
+    def _term_scores(
+        self, term: str, total_docs: int, prefix: bool, within: Optional[Dict[Hashable, float]]
+    ) -> Dict[Hashable, float]:
+        """
+        doc_id -> score for one query term. With `within`, only those docs are
+        scored, so a rare earlier term keeps a broad prefix cheap.
+        """
+        scores: Dict[Hashable, float] = {}
+        tokens = self._expand(term) if prefix else ([term] if term in self._postings else [])
+        for token in tokens:
+            posting = self._postings[token]
+            idf = math.log(1.0 + total_docs / len(posting))
+            factor = idf if token == term else idf * PREFIX_MATCH_WEIGHT
+            if within is not None and len(within) < len(posting):
+                pairs = ((doc_id, posting[doc_id]) for doc_id in within if doc_id in posting)
+            else:
+                pairs = posting.items()
+            for doc_id, weight in pairs:
+                score = weight * factor
+                if score > scores.get(doc_id, 0.0):
+                    scores[doc_id] = score
+        return scores
+
+    def search(
+        self,
+        query: str,
+        offset: int = 0,
+        limit: int = 20,
+        accept: Optional[Callable[[Hashable], bool]] = None,
+    ) -> Tuple[int, List[Tuple[Hashable, float]]]:
+        """
+        Returns (total matches, [(doc_id, score), ...] for the requested page).
+        accept(doc_id) filters candidates before ranking, so pages stay full.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+        total_docs = len(self._doc_terms) or 1
+        # Complete words first, rarest first, then the (possibly partial) last word
+        last = terms.pop()
+        terms.sort(key=lambda t: len(self._postings.get(t, ())))
+        scores: Optional[Dict[Hashable, float]] = None
+        for term, prefix in [(t, False) for t in terms] + [(last, True)]:
+            term_scores = self._term_scores(term, total_docs, prefix, scores)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: s + term_scores[doc_id] for doc_id, s in scores.items() if doc_id in term_scores}
+            if not scores:
+                return 0, []
+        if accept is not None:
+            scores = {doc_id: s for doc_id, s in scores.items() if accept(doc_id)}
+        order = self._doc_order
+        page = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], order.get(item[0], 0)))
+        return len(scores), [(doc_id, round(score, 4)) for doc_id, score in page[offset:]]
+
+
+# Room index: doc_id = room_id
+ROOM_INDEX = InvertedIndex()
+
+# Per-room message indexes: room_id -> index with doc_id = message seq
+_MESSAGE_INDEXES: Dict[str, InvertedIndex] = {}
+
+
+def index_room(room: Dict) -> None:
+    ROOM_INDEX.add(room["room_id"], {
+        field: (room.get(field), weight) for field, weight in ROOM_FIELD_WEIGHTS.items()
+    })
+
+
+def unindex_room(room_id: str) -> None:
+    ROOM_INDEX.remove(room_id)
+    drop_messages(room_id)
+
+
+def index_message(room_id: str, msg: Dict) -> None:
+    index = _MESSAGE_INDEXES.get(room_id)
+    if index is None:
+        index = _MESSAGE_INDEXES[room_id] = InvertedIndex()
+    index.add(msg["seq"], {"message": (msg.get("message"), 1.0)})
+
+
+def drop_messages(room_id: str) -> None:
+    _MESSAGE_INDEXES.pop(room_id, None)
+
+
+def search_rooms(query: str, offset: int = 0, limit: int = 20, accept=None):
+    return ROOM_INDEX.search(query, offset, limit, accept)
+
+
+def search_messages(room_id: str, query: str, offset: int = 0, limit: int = 20):
+    index = _MESSAGE_INDEXES.get(room_id)
+    if index is None:
+        return 0, []
+    return index.search(query, offset, limit)
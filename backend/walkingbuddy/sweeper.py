@@ -0,0 +1,128 @@
+"""
+sweeper.py
+
+Background room lifecycle sweeper.
+
+Rooms are expired from a min-heap keyed by their next deadline instead of by
+scanning ROOMS_DB:
+- an active room expires ROOM_MEET_GRACE_SECONDS after its meet_time, or after
+  ROOM_IDLE_TTL_SECONDS without activity, and is marked "complete"
+- a complete room is deleted (with its chat) ROOM_COMPLETE_TTL_SECONDS after
+  its last activity
+
+Activity only updates ROOM_ACTIVITY, so when an entry comes due its deadline is
+recomputed and the entry is pushed back if the room has been busy since it was
+scheduled. track() pulls a deadline forward (e.g. when the last member leaves);
+the superseded heap entry is skipped when it is popped.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .database import ROOM_ACTIVITY, RoomDatabase
+
+logger = logging.getLogger(__name__)
+
+ROOM_IDLE_TTL_SECONDS = float(os.getenv("ROOM_IDLE_TTL_SECONDS", str(6 * 3600)))
+ROOM_MEET_GRACE_SECONDS = float(os.getenv("ROOM_MEET_GRACE_SECONDS", str(12 * 3600)))
+ROOM_COMPLETE_TTL_SECONDS = float(os.getenv("ROOM_COMPLETE_TTL_SECONDS", "600"))
+ROOM_SWEEP_INTERVAL_SECONDS = float(os.getenv("ROOM_SWEEP_INTERVAL_SECONDS", "30"))
+
+RoomEvents = List[Tuple[str, Dict]]
+
+
+def _parse_meet_time(value) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        # datetime-local values from the frontend carry no zone; the grace period absorbs the offset
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class RoomSweeper:
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._queued: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def deadline_for(self, room: Dict) -> float:
+        last_activity = ROOM_ACTIVITY.get(room["room_id"], time.time())
+        if room.get("status") != "active":
+            return last_activity + ROOM_COMPLETE_TTL_SECONDS
+        deadline = last_activity + ROOM_IDLE_TTL_SECONDS
+        meet = _parse_meet_time(room.get("meet_time"))
+        if meet is not None:
+            deadline = min(deadline, meet + ROOM_MEET_GRACE_SECONDS)
+        return deadline
+
+    def track(self, room: Dict) -> None:
+        room_id = room["room_id"]
+        deadline = self.deadline_for(room)
+        queued = self._queued.get(room_id)
+        if queued is not None and queued <= deadline:
+            return
+        self._queued[room_id] = deadline
+        heapq.heappush(self._heap, (deadline, room_id))
+
+    def collect_due(self, now: Optional[float] = None) -> RoomEvents:
+        """
+        Pops every entry whose deadline has passed and applies the transition.
+
+        Returns:
+            (event_type, room) pairs for the broadcast batch
+        """
+        now = time.time() if now is None else now
+        events: RoomEvents = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            entry_deadline, room_id = heapq.heappop(heap)
+            if self._queued.get(room_id) != entry_deadline:
+                continue
+            del self._queued[room_id]
+            room = RoomDatabase.get_room(room_id)
+            if room is None:
+                continue
+            deadline = self.deadline_for(room)
+            if deadline > now:
+                # Room saw activity since it was scheduled
+                self.track(room)
+                continue
+            try:
+                if room.get("status") == "active":
+                    room = RoomDatabase.update_room_status(room_id, "complete")
+                    events.append(("room:update", room))
+                    self.track(room)
+                else:
+                    RoomDatabase.delete_room(room_id)
+                    events.append(("room:delete", {"room_id": room_id}))
+            except ValueError:
+                # Deleted by a handler between get_room and the transition
+                continue
+        return events
+
+    async def run(self, emit: Callable[[RoomEvents], Awaitable[None]]) -> None:
+        logger.info("Room sweeper started (interval=%ss)", ROOM_SWEEP_INTERVAL_SECONDS)
+        while True:
+            await asyncio.sleep(ROOM_SWEEP_INTERVAL_SECONDS)
+            try:
+                events = self.collect_due()
+                if events:
+                    logger.info("Room sweeper expired %d room event(s)", len(events))
+                    await emit(events)
+            except Exception:
+                logger.exception("Room sweeper pass failed")
+
+
+sweeper = RoomSweeper()
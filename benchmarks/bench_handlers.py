@@ -0,0 +1,135 @@
+"""
+bench_handlers.py
+
+Per-request overhead of the in-memory handlers. The app runs in this process
+behind httpx's ASGI transport (no sockets, no upstreams, full middleware
+stack), so what changes between two runs is the handlers' own cost: the
+threadpool hop for plain `def` routes, locking, serialization. Each operation
+runs on its own for --seconds with --concurrency closed-loop clients.
+
+--save / --compare work like bench_load (RPS or p99 regressions beyond
+--tolerance exit 1). To compare two trees, --save on one and --compare on the other.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_handlers
+    python -m benchmarks.bench_handlers --seconds 5 --concurrency 32 --save benchmarks/handlers_baseline.json
+    python -m benchmarks.bench_handlers --compare benchmarks/handlers_baseline.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("STATE_DIR", "")
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+
+import httpx
+
+from benchmarks.bench_load import Recorder, compare, print_table, summarize
+
+ROOMS = 200
+MEMBERS = 5
+MESSAGES_PER_ROOM = 100
+
+
+def seed_users(count: int):
+    # Straight into the store: hashing a password per seeded user is not what this measures
+    from backend.auth import auth_storage
+    return [auth_storage._store_user(f"Walker {i}", f"bench{i}@mylaurier.ca", "x")["id"] for i in range(count)]
+
+
+async def seed(client: httpx.AsyncClient, users):
+    rooms = []
+    for i in range(ROOMS):
+        creator = users[i % len(users)]
+        r = await client.post("/api/rooms/create", json={
+            "user_id": creator, "destination": f"{i} University Ave", "name": f"Library walk {i}",
+            "start_coord": [43.47, -80.52], "dest_coord": [43.48, -80.53], "max_members": MEMBERS + 1,
+        })
+        room_id = r.json()["room"]["room_id"]
+        for m in range(1, MEMBERS):
+            await client.post("/api/rooms/join", json={"room_id": room_id, "user_id": users[(i + m) % len(users)]})
+        for n in range(MESSAGES_PER_ROOM):
+            await client.post("/api/chat/send", json={"room_id": room_id, "user_id": creator, "content": f"meet at gate {n}"})
+        rooms.append((room_id, creator))
+    return rooms
+
+
+def operations(rooms, users):
+    """op name -> factory(client, i) returning the request coroutine."""
+    return {
+        "rooms.list": lambda c, i: c.get("/api/rooms/list"),
+        "rooms.search": lambda c, i: c.get("/api/rooms/search", params={"q": f"walk {i % ROOMS}"}),
+        "rooms.mine": lambda c, i: c.get("/api/rooms/mine", params={"user_id": users[i % len(users)]}),
+        "chat.messages": lambda c, i: c.get(f"/api/chat/{rooms[i % ROOMS][0]}/messages"),
+        "chat.search": lambda c, i: c.get(f"/api/chat/{rooms[i % ROOMS][0]}/search", params={"q": "gate"}),
+        "chat.send": lambda c, i: c.post("/api/chat/send", json={
+            "room_id": rooms[i % ROOMS][0], "user_id": rooms[i % ROOMS][1], "content": "on my way"}),
+        "chat.clear": lambda c, i: c.delete(f"/api/chat/{rooms[i % ROOMS][0]}/messages",
+                                            params={"user_id": rooms[i % ROOMS][1]}),
+        "users.get": lambda c, i: c.get(f"/api/users/{users[i % len(users)]}"),
+        "users.batch": lambda c, i: c.post("/api/users/batch", json=users[i % 50:i % 50 + 20]),
+    }
+
+
+async def run(args):
+    from backend import main as app_module
+
+    users = seed_users(ROOMS)
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="https://testserver") as client:
+        rooms = await seed(client, users)
+        ops = operations(rooms, users)
+        selected = args.ops or list(ops)
+        counter = itertools.count()
+        results = {}
+        for op in selected:
+            factory = ops[op]
+            # Short warm-up so first-call costs (imports, caches) don't land in the numbers
+            await asyncio.gather(*(factory(client, next(counter)) for _ in range(args.concurrency)))
+            start = time.perf_counter()
+            deadline = start + args.seconds
+            rec = Recorder(measure_from=start)
+
+            async def worker():
+                while time.perf_counter() < deadline:
+                    await rec.timed(op, factory(client, next(counter)))
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            results.update(summarize(rec, time.perf_counter() - start))
+    return {"results": results, "memory": {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=3.0, help="measured time per operation")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--ops", nargs="*", help="subset of operations to run")
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_table(report["results"])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+bench_load.py
+
+End-to-end load test. Starts benchmarks/fake_upstream.py and the app (uvicorn,
+one worker), each in its own process, then runs these mixes concurrently:
+    route      closed-loop GET /api/navigation/route over a pool of places
+               (a small pool means more route cache hits)
+    rooms      create -> join -> list -> leave -> delete cycles
+    chat       pollers hitting GET /api/chat/{room}/messages every 1.5 s like
+               chat.js, each sending a message every --send-every polls
+    ws         N subscribers on /api/rooms/ws, counting the frames they receive
+
+It reports throughput, p50/p99 latency and errors per operation, plus app RSS
+(from /proc, Linux only). --save writes the results as a JSON baseline, and
+--compare checks a run against one, exiting 1 when p99 or throughput regressed
+by more than --tolerance.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_load --duration 30 --save benchmarks/baseline.json
+    python -m benchmarks.bench_load --duration 30 --compare benchmarks/baseline.json
+    python -m benchmarks.bench_load --ws-subscribers 500 --chat-pollers 200 --error-rate 0.05 --fail osrm-project=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_upstream import add_fault_arguments
+
+CHAT_POLL_SECONDS = 1.5  # matches setInterval(loadMessages, 1500) in docs/modules/chat.js
+
+
+# Process management (also used by the other end-to-end benchmarks)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_upstream(port: int, args) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "benchmarks.fake_upstream", "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate)]
+    for failure in args.fail or ():
+        cmd += ["--fail", failure]
+    return subprocess.Popen(cmd)
+
+
+def app_env(upstream_port: Optional[int], extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "STATE_DIR": "",
+        "TRACE_SAMPLE_RATE": "0",
+        "SESSION_SECRET": "benchmark-secret",
+    })
+    if upstream_port is not None:
+        base = f"http://127.0.0.1:{upstream_port}"
+        env.update({"NOMINATIM_URL": base, "PHOTON_URL": base, "OSRM_PROJECT_URL": base, "OSRM_FOSSGIS_URL": base})
+    env.update(extra or {})
+    return env
+
+
+def start_app(port: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--ws", "websockets", "--log-level", "warning", "--no-access-log"]
+    return subprocess.Popen(cmd, env=env)
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> float:
+    """Polls `url` until it answers; returns seconds waited."""
+    start = time.perf_counter()
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() - start < timeout:
+            try:
+                await client.get(url, timeout=1.0)
+                return time.perf_counter() - start
+            except httpx.TransportError:
+                await asyncio.sleep(0.02)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def stop(*procs: subprocess.Popen) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# Measurement
+
+class Recorder:
+    def __init__(self, measure_from: float):
+        self.measure_from = measure_from
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.ws_connect: List[float] = []
+
+    async def timed(self, op: str, coro):
+        """Awaits `coro` (an httpx request), recording latency and treating non-2xx or success=false as errors."""
+        start = time.perf_counter()
+        try:
+            r = await coro
+            ok = r.status_code < 400
+            data = None
+            if ok and r.headers.get("content-type", "").startswith("application/json"):
+                data = r.json()
+                ok = not (isinstance(data, dict) and data.get("success") is False)
+        except httpx.HTTPError:
+            ok, data = False, None
+        end = time.perf_counter()
+        if start >= self.measure_from:
+            self.latencies[op].append(end - start)
+            if not ok:
+                self.errors[op] += 1
+        return data if ok else None
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if time.perf_counter() >= self.measure_from:
+            self.counters[name] += amount
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(recorder: Recorder, seconds: float) -> Dict[str, dict]:
+    results = {}
+    for op, values in sorted(recorder.latencies.items()):
+        values.sort()
+        results[op] = {
+            "count": len(values),
+            "rps": round(len(values) / seconds, 2),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "error_rate": round(recorder.errors[op] / len(values), 4),
+        }
+    return results
+
+
+def print_table(results: Dict[str, dict]) -> None:
+    print(f"{'operation':<16}{'count':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for op, r in results.items():
+        print(f"{op:<16}{r['count']:>8}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['error_rate']:>9.2%}")
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns human-readable regressions of `current` against `baseline`."""
+    problems = []
+    for op, base in baseline.get("results", {}).items():
+        now = current["results"].get(op)
+        if now is None:
+            problems.append(f"{op}: missing from this run")
+            continue
+        if base["p99_ms"] and now["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            problems.append(f"{op}: p99 {now['p99_ms']} ms vs baseline {base['p99_ms']} ms")
+        if base["rps"] and now["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{op}: {now['rps']} req/s vs baseline {base['rps']} req/s")
+        if now["error_rate"] > base["error_rate"] + 0.01:
+            problems.append(f"{op}: error rate {now['error_rate']:.2%} vs baseline {base['error_rate']:.2%}")
+    base_peak = baseline.get("memory", {}).get("peak_rss_mb")
+    peak = current.get("memory", {}).get("peak_rss_mb")
+    if base_peak and peak and peak > base_peak * (1 + tolerance):
+        problems.append(f"memory: peak RSS {peak} MB vs baseline {base_peak} MB")
+    return problems
+
+
+# Workload mixes
+
+PLACES = [f"{n} King Street, Waterloo" for n in range(1, 1001)]
+
+
+async def route_user(client, rec: Recorder, deadline: float, places: List[str]):
+    while time.perf_counter() < deadline:
+        start, dest = random.sample(places, 2)
+        await rec.timed("route", client.get("/api/navigation/route", params={"start": start, "destination": dest}))
+
+
+async def room_user(client, rec: Recorder, deadline: float, index: int):
+    creator, joiner = f"bench-creator-{index}", f"bench-joiner-{index}"
+    while time.perf_counter() < deadline:
+        data = await rec.timed("room_create", client.post("/api/rooms/create", json={
+            "user_id": creator, "destination": random.choice(PLACES), "room_name": f"bench {index}",
+            "start_coord": [43.47, -80.54], "dest_coord": [43.45, -80.49],
+        }))
+        if not data:
+            continue
+        room_id = data["room"]["room_id"]
+        await rec.timed("room_join", client.post("/api/rooms/join", json={"room_id": room_id, "user_id": joiner}))
+        await rec.timed("room_list", client.get("/api/rooms/list"))
+        await rec.timed("room_leave", client.post("/api/rooms/leave", json={"room_id": room_id, "user_id": joiner}))
+        await rec.timed("room_delete", client.delete(f"/api/rooms/{room_id}", params={"user_id": creator}))
+
+
+async def chat_poller(client, rec: Recorder, deadline: float, room_id: str, user_id: str, send_every: int):
+    # Stagger pollers so they do not all fire on the same tick
+    await asyncio.sleep(random.uniform(0, CHAT_POLL_SECONDS))
+    polls = 0
+    while time.perf_counter() < deadline:
+        tick = time.perf_counter()
+        await rec.timed("chat_poll", client.get(f"/api/chat/{room_id}/messages", params={"limit": 50}))
+        polls += 1
+        if send_every and polls % send_every == 0:
+            await rec.timed("chat_send", client.post("/api/chat/send", json={
+                "room_id": room_id, "user_id": user_id, "content": f"message {polls} from {user_id}",
+            }))
+        await asyncio.sleep(max(0.0, CHAT_POLL_SECONDS - (time.perf_counter() - tick)))
+
+
+async def ws_subscriber(url: str, rec: Recorder, deadline: float):
+    import websockets
+
+    start = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            rec.ws_connect.append(time.perf_counter() - start)
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(ws.recv(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return
+                rec.count("ws_frames")
+    except Exception:
+        rec.counters["ws_failed"] += 1
+
+
+async def setup_chat_rooms(client, pollers: int, per_room: int) -> List[tuple]:
+    """Creates rooms for the pollers and joins each poller; returns (room_id, user_id) per poller."""
+    assignments = []
+    room_id = None
+    for i in range(pollers):
+        user_id = f"bench-poller-{i}"
+        if i % per_room == 0:
+            r = await client.post("/api/rooms/create", json={
+                "user_id": user_id, "destination": "Bench chat", "max_members": per_room,
+                "start_coord": [43.47, -80.54], "dest_coord": [43.45, -80.49],
+            })
+            room_id = r.json()["room"]["room_id"]
+        else:
+            await client.post("/api/rooms/join", json={"room_id": room_id, "user_id": user_id})
+        assignments.append((room_id, user_id))
+    return assignments
+
+
+async def run(args) -> dict:
+    upstream_port, app_port = free_port(), free_port()
+    upstream = start_upstream(upstream_port, args)
+    app = start_app(app_port, app_env(upstream_port))
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        await wait_ready(f"http://127.0.0.1:{upstream_port}/search")
+        await wait_ready(f"{base_url}/ping")
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+            assignments = await setup_chat_rooms(client, args.chat_pollers, args.room_size)
+            rss_start = rss_mb(app.pid)
+
+            now = time.perf_counter()
+            rec = Recorder(measure_from=now + args.warmup)
+            deadline = now + args.warmup + args.duration
+            places = PLACES[:args.route_places]
+            tasks = [ws_subscriber(f"ws://127.0.0.1:{app_port}/api/rooms/ws", rec, deadline) for _ in range(args.ws_subscribers)]
+            tasks += [route_user(client, rec, deadline, places) for _ in range(args.route_users)]
+            tasks += [room_user(client, rec, deadline, i) for i in range(args.room_users)]
+            tasks += [chat_poller(client, rec, deadline, room_id, user_id, args.send_every) for room_id, user_id in assignments]
+
+            peak = [rss_start or 0.0]
+
+            async def sample_memory():
+                while time.perf_counter() < deadline:
+                    value = rss_mb(app.pid)
+                    if value:
+                        peak[0] = max(peak[0], value)
+                    await asyncio.sleep(0.5)
+
+            await asyncio.gather(sample_memory(), *tasks)
+            rss_end = rss_mb(app.pid)
+    finally:
+        stop(app, upstream)
+
+    results = summarize(rec, args.duration)
+    connect_times = sorted(rec.ws_connect)
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+        "results": results,
+        "websocket": {
+            "connected": len(connect_times),
+            "failed": rec.counters["ws_failed"],
+            "connect_p99_ms": round(percentile(connect_times, 0.99) * 1000, 2),
+            "frames_per_s": round(rec.counters["ws_frames"] / args.duration, 1),
+        },
+        "memory": {
+            "start_rss_mb": rss_start and round(rss_start, 1),
+            "peak_rss_mb": peak[0] and round(peak[0], 1),
+            "end_rss_mb": rss_end and round(rss_end, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--route-users", type=int, default=4)
+    parser.add_argument("--route-places", type=int, default=50, help="distinct addresses the route mix draws from")
+    parser.add_argument("--room-users", type=int, default=4)
+    parser.add_argument("--chat-pollers", type=int, default=50)
+    parser.add_argument("--room-size", type=int, default=5, help="chat pollers per room")
+    parser.add_argument("--send-every", type=int, default=10, help="each poller sends one message per this many polls")
+    parser.add_argument("--ws-subscribers", type=int, default=50)
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    add_fault_arguments(parser)
+    parser.add_argument("--save", metavar="PATH", help="write results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_table(report["results"])
+    print(f"websocket: {report['websocket']}")
+    print(f"memory: {report['memory']}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+bench_locations.py
+
+In-process cost of live location sharing: G groups of M members each send
+updates at --update-hz while the hub ticks at LOCATION_TICK_HZ. Sockets are
+stand-ins that only count bytes, so the numbers are the server's own work
+(parse, store, coalesce, serialize, fan out) per second of simulated walking,
+next to the frame count an uncoalesced N^2 relay would have sent.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_locations
+    python -m benchmarks.bench_locations --groups 500 --members 8 --update-hz 2 --seconds 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from backend.walkingbuddy.locations import LOCATION_TICK_HZ, LocationHub, parse_position
+
+
+class CountingSocket:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+
+async def count_send(websocket: CountingSocket, text: str) -> None:
+    websocket.frames += 1
+    websocket.bytes += len(text)
+
+
+async def run(groups: int, members: int, update_hz: float, seconds: float):
+    hub = LocationHub()
+    sockets = {}
+    for g in range(groups):
+        for m in range(members):
+            ws = sockets[(g, m)] = CountingSocket()
+            hub.subscribe(ws, f"room-{g}", f"user-{m}")
+
+    ticks = int(seconds * LOCATION_TICK_HZ)
+    updates_per_tick = max(1, round(update_hz / LOCATION_TICK_HZ))
+    update_seconds = 0.0
+    tick_seconds = 0.0
+    updates = 0
+    for _ in range(ticks):
+        start = time.perf_counter()
+        for _ in range(updates_per_tick):
+            for (g, m) in sockets:
+                # What the socket handler does per frame: parse JSON, validate, store
+                frame = json.dumps({"op": "location:update", "room_id": f"room-{g}",
+                                    "lat": 43.47 + random.random() * 1e-3, "lon": -80.52, "accuracy": 8})
+                msg = json.loads(frame)
+                hub.update(msg["room_id"], f"user-{m}", parse_position(msg))
+                updates += 1
+        update_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        await hub._send_frames(count_send)
+        tick_seconds += time.perf_counter() - start
+
+    frames = sum(ws.frames for ws in sockets.values())
+    sent = sum(ws.bytes for ws in sockets.values())
+    naive_frames = updates * (members - 1)
+    print(f"{groups} groups x {members} members, {update_hz} updates/s each, tick {LOCATION_TICK_HZ} Hz, {seconds}s simulated")
+    print(f"  updates handled     {updates:>10}   {update_seconds / seconds * 100:6.2f}% of one core")
+    print(f"  ticks               {ticks:>10}   {tick_seconds / max(ticks, 1) * 1000:8.2f} ms per tick "
+          f"({tick_seconds / seconds * 100:.2f}% of one core)")
+    print(f"  frames sent         {frames:>10}   {sent / seconds / 1024:8.1f} KiB/s")
+    print(f"  uncoalesced relay   {naive_frames:>10}   frames ({naive_frames / max(frames, 1):.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=300)
+    parser.add_argument("--members", type=int, default=6)
+    parser.add_argument("--update-hz", type=float, default=2.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.groups, args.members, args.update_hz, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
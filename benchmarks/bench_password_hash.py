@@ -0,0 +1,75 @@
+"""
+bench_password_hash.py
+
+Reports logins per second per core for each password hashing cost setting,
+plus aggregate throughput through the auth_storage hashing worker pool.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_password_hash
+    python -m benchmarks.bench_password_hash --seconds 3 --scrypt-n 8192 16384 32768
+"""
+import argparse
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.auth import auth_storage
+
+PASSWORD = "correct horse battery staple"
+
+
+def _scrypt_hash(n: int, r: int, p: int) -> str:
+    salt = secrets.token_bytes(16)
+    digest = auth_storage._scrypt(PASSWORD, salt, n, r, p)
+    return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+
+def _pbkdf2_hash(iterations: int) -> str:
+    salt = secrets.token_bytes(16)
+    digest = auth_storage._pbkdf2(PASSWORD, salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def _logins_per_second(stored_hash: str, seconds: float, workers: int) -> float:
+    """Runs verifications for roughly `seconds` and returns the rate."""
+    def loop(deadline):
+        count = 0
+        while time.perf_counter() < deadline:
+            assert auth_storage._verify_password_hash(stored_hash, PASSWORD)
+            count += 1
+        return count
+
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        total = sum(pool.map(loop, [deadline] * workers))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=2.0, help="time spent per setting")
+    parser.add_argument("--scrypt-n", type=int, nargs="*", default=[4096, 8192, 16384, 32768])
+    parser.add_argument("--scrypt-r", type=int, default=8)
+    parser.add_argument("--scrypt-p", type=int, default=1)
+    parser.add_argument("--pbkdf2-iterations", type=int, nargs="*", default=[100000, 300000, 600000])
+    parser.add_argument("--workers", type=int, default=auth_storage.PASSWORD_HASH_WORKERS,
+                        help="threads for the pooled measurement (defaults to PASSWORD_HASH_WORKERS)")
+    args = parser.parse_args()
+
+    settings = [(f"scrypt n={n} r={args.scrypt_r} p={args.scrypt_p}", _scrypt_hash(n, args.scrypt_r, args.scrypt_p))
+                for n in args.scrypt_n]
+    settings += [(f"pbkdf2_sha256 iterations={i}", _pbkdf2_hash(i)) for i in args.pbkdf2_iterations]
+
+    cores = os.cpu_count() or 1
+    print(f"cores={cores} pool_workers={args.workers} seconds_per_setting={args.seconds}")
+    print(f"{'setting':<36} {'ms/login':>9} {'logins/s/core':>14} {'pool logins/s':>14}")
+    for label, stored_hash in settings:
+        single = _logins_per_second(stored_hash, args.seconds, 1)
+        pooled = _logins_per_second(stored_hash, args.seconds, args.workers)
+        print(f"{label:<36} {1000.0 / single:>9.1f} {single:>14.1f} {pooled:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
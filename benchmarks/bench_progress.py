@@ -0,0 +1,114 @@
+"""
+bench_progress.py
+
+Cost of RouteTrack.progress (backend/navigation/nav_logic.py) per fix, with
+numpy and with the plain-loop fallback, on synthetic walking routes: a short
+one (scanned in full), a long one (grid index) and an out-and-back one (tie
+breaking on previous progress). Fixes are scattered on and off each route.
+
+numpy is optional, so the two paths must agree: every fix is run through both
+and the results compared field by field. Any mismatch is printed and the run
+exits 1. Without numpy installed only the plain loop is timed.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_progress
+    python -m benchmarks.bench_progress --fixes 5000 --seed 7
+"""
+import argparse
+import copy
+import math
+import random
+import sys
+import time
+
+from backend.navigation import nav_logic
+
+# Rounded outputs may differ in the last digit between the two paths
+TOLERANCE = 0.11
+
+
+def random_walk(rng: random.Random, points: int, step_m: float = 15.0):
+    lat, lon = 43.4723, -80.5449
+    heading = rng.uniform(0, 2 * math.pi)
+    geometry = [[lat, lon]]
+    for _ in range(points - 1):
+        heading += rng.uniform(-0.6, 0.6)
+        lat += step_m * math.cos(heading) / 111_320
+        lon += step_m * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+        geometry.append([lat, lon])
+    return geometry
+
+
+def routes(rng: random.Random):
+    short = random_walk(rng, 40)
+    long = random_walk(rng, 1500)
+    out = random_walk(rng, 200)
+    return {"short": short, "long": long, "out-and-back": out + out[-2::-1]}
+
+
+def fixes(rng: random.Random, geometry, count: int):
+    """(lat, lon, accuracy, previous_m) near random points of the route, some well off it."""
+    result = []
+    for _ in range(count):
+        lat, lon = rng.choice(geometry)
+        spread = 150.0 if rng.random() < 0.2 else 10.0
+        lat += rng.gauss(0, spread) / 111_320
+        lon += rng.gauss(0, spread) / 80_000
+        previous = rng.choice((None, rng.uniform(0, 5000)))
+        result.append((lat, lon, rng.uniform(0, 30), previous))
+    return result
+
+
+def timed(track, points):
+    start = time.perf_counter()
+    results = [track.progress(*p) for p in points]
+    return results, (time.perf_counter() - start) / len(points)
+
+
+def mismatches(name, points, vectorized, looped):
+    problems = []
+    for point, a, b in zip(points, vectorized, looped):
+        for field, value in a.items():
+            other = b[field]
+            same = value == other if isinstance(value, bool) else abs(value - other) <= TOLERANCE
+            if not same:
+                problems.append(f"{name} {point}: {field} numpy={value} loop={other}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixes", type=int, default=2000, help="fixes per route")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    has_numpy = nav_logic._np() is not None
+    if not has_numpy:
+        print("numpy is not installed: timing the plain loop only, parity not checked")
+    print(f"{'route':<14} {'segments':>8} {'loop us':>9} {'numpy us':>9}")
+    problems = []
+    for name, geometry in routes(rng).items():
+        track = nav_logic.RouteTrack(geometry, 0, 0)
+        looped_track = copy.copy(track)
+        looped_track._arrays = None
+        points = fixes(rng, geometry, args.fixes)
+        looped, loop_s = timed(looped_track, points)
+        numpy_col = "-"
+        if has_numpy:
+            vectorized, numpy_s = timed(track, points)
+            numpy_col = f"{numpy_s * 1e6:.1f}"
+            problems.extend(mismatches(name, points, vectorized, looped))
+        print(f"{name:<14} {len(track):>8} {loop_s * 1e6:>9.1f} {numpy_col:>9}")
+
+    for problem in problems[:20]:
+        print(f"MISMATCH {problem}")
+    if problems:
+        print(f"{len(problems)} mismatches between the numpy and plain-loop paths")
+        sys.exit(1)
+    if has_numpy:
+        print("numpy and plain-loop paths agree")
+
+
+if __name__ == "__main__":
+    main()
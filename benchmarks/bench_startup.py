@@ -0,0 +1,117 @@
+"""
+bench_startup.py
+
+Measures cold start: how long `import backend.main` takes in a fresh
+interpreter, and how long from spawning uvicorn until /ping answers (the
+number the host's spin-up actually waits on). Each is repeated --runs times
+and the median reported. --top lists the slowest imports (python -X importtime).
+
+--save / --compare work like bench_load: compare exits 1 when the median
+import or ready time regressed by more than --tolerance.
+
+Usage (from the repo root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --top 15 --save benchmarks/startup_baseline.json
+    python -m benchmarks.bench_startup --compare benchmarks/startup_baseline.json
+"""
+import argparse
+import http.client
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_load import app_env, free_port, start_app, stop
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import backend.main; print(time.perf_counter() - t)"
+
+
+def import_seconds(env) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def ready_seconds(env, timeout: float = 30.0) -> float:
+    """Spawns the app and returns seconds until GET /ping succeeds."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = start_app(port, env)
+    try:
+        while time.perf_counter() - start < timeout:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1.0)
+            try:
+                conn.request("GET", "/ping")
+                if conn.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+            finally:
+                conn.close()
+        raise RuntimeError(f"app did not answer /ping within {timeout}s")
+    finally:
+        stop(proc)
+
+
+def slowest_imports(env, top: int):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.main"],
+                         env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="also list the N slowest imports (cumulative)")
+    parser.add_argument("--state-dir", default="", help="STATE_DIR for the app, to include snapshot restore")
+    parser.add_argument("--save", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    env = app_env(None, {"STATE_DIR": args.state_dir})
+    imports = [import_seconds(env) for _ in range(args.runs)]
+    readies = [ready_seconds(env) for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "import_min_ms": round(min(imports) * 1000, 1),
+        "ready_ms": round(statistics.median(readies) * 1000, 1),
+        "ready_min_ms": round(min(readies) * 1000, 1),
+    }
+    print(f"import backend.main  median {report['import_ms']} ms  (min {report['import_min_ms']} ms)")
+    print(f"spawn -> /ping 200   median {report['ready_ms']} ms  (min {report['ready_min_ms']} ms)")
+
+    if args.top:
+        print(f"\n{'cumulative ms':>14}{'self ms':>10}  module")
+        for cumulative_us, self_us, name in slowest_imports(env, args.top):
+            print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = [
+            f"{key}: {report[key]} ms vs baseline {baseline[key]} ms"
+            for key in ("import_ms", "ready_ms")
+            if baseline.get(key) and report[key] > baseline[key] * (1 + args.tolerance)
+        ]
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
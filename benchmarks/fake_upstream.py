@@ -0,0 +1,149 @@
+"""
+fake_upstream.py
+
+Local stand-in for Nominatim, Photon and the OSRM mirrors, so the app can be
+load-tested without touching the public services. Point the app at it with
+    NOMINATIM_URL=http://127.0.0.1:9100 PHOTON_URL=http://127.0.0.1:9100
+    OSRM_PROJECT_URL=http://127.0.0.1:9100 OSRM_FOSSGIS_URL=http://127.0.0.1:9100
+
+Geocoding answers are derived from a hash of the query, so the same address
+always maps to the same point. Routes are straight lines with a realistic
+number of geometry points and steps.
+
+Usage (from the repo root):
+    python -m benchmarks.fake_upstream --port 9100 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+    python -m benchmarks.fake_upstream --fail osrm-project=1.0 --fail nominatim=0.2
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+UPSTREAMS = ("nominatim", "photon", "osrm-project", "osrm-fossgis")
+ROUTE_POINTS = 250
+
+
+class Faults:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, per_upstream=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.per_upstream = dict(per_upstream or {})
+
+    async def apply(self, upstream: str):
+        """Sleeps for the configured latency; returns an error response when one is injected."""
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        if random.random() < self.per_upstream.get(upstream, self.error_rate):
+            return PlainTextResponse("injected failure", status_code=503)
+        return None
+
+
+def _point_for(query: str):
+    digest = hashlib.sha1(query.encode("utf-8")).digest()
+    # Somewhere around Waterloo, ON, within ~20 km
+    lat = 43.46 + (digest[0] - 128) / 128 * 0.2
+    lon = -80.52 + (digest[1] - 128) / 128 * 0.2
+    return round(lat, 6), round(lon, 6)
+
+
+def build_app(faults: Faults) -> Starlette:
+    async def search(request: Request):
+        failure = await faults.apply("nominatim")
+        if failure:
+            return failure
+        lat, lon = _point_for(request.query_params.get("q", ""))
+        return JSONResponse([{"lat": str(lat), "lon": str(lon), "display_name": request.query_params.get("q", "")}])
+
+    async def reverse(request: Request):
+        failure = await faults.apply("nominatim")
+        if failure:
+            return failure
+        lat, lon = request.query_params.get("lat"), request.query_params.get("lon")
+        return JSONResponse({
+            "display_name": f"{lat}, {lon}, Waterloo, Ontario, Canada",
+            "address": {"city": "Waterloo", "state": "Ontario", "country": "Canada"},
+            "lat": lat, "lon": lon,
+        })
+
+    async def photon(request: Request):
+        failure = await faults.apply("photon")
+        if failure:
+            return failure
+        lat, lon = _point_for(request.query_params.get("q", ""))
+        return JSONResponse({"features": [{"geometry": {"type": "Point", "coordinates": [lon, lat]}}]})
+
+    def _route_body(coords: str, params):
+        (lon1, lat1), (lon2, lat2) = [tuple(float(v) for v in pair.split(",")) for pair in coords.split(";")[:2]]
+        n = ROUTE_POINTS
+        line = [[lon1 + (lon2 - lon1) * i / (n - 1), lat1 + (lat2 - lat1) * i / (n - 1)] for i in range(n)]
+        distance = (((lat2 - lat1) * 111000) ** 2 + ((lon2 - lon1) * 80000) ** 2) ** 0.5
+        steps = [
+            {"distance": distance / 10, "duration": distance / 14, "name": f"Street {i}",
+             "maneuver": {"type": "turn", "modifier": "left", "location": line[i * (n // 10)]}}
+            for i in range(10)
+        ]
+        route = {
+            "distance": distance, "duration": distance / 1.4,
+            "legs": [{"steps": steps if params.get("steps") == "true" else [], "distance": distance, "duration": distance / 1.4}],
+        }
+        if params.get("overview") != "false":
+            route["geometry"] = {"type": "LineString", "coordinates": line}
+        return {"code": "Ok", "routes": [route]}
+
+    def osrm_handler(upstream: str):
+        async def handler(request: Request):
+            failure = await faults.apply(upstream)
+            if failure:
+                return failure
+            return JSONResponse(_route_body(request.path_params["coords"], request.query_params))
+        return handler
+
+    return Starlette(routes=[
+        Route("/search", search),
+        Route("/reverse", reverse),
+        Route("/api/", photon),
+        Route("/route/v1/{mode}/{coords}", osrm_handler("osrm-project")),
+        Route("/routed-car/route/v1/{mode}/{coords}", osrm_handler("osrm-fossgis")),
+        Route("/routed-foot/route/v1/{mode}/{coords}", osrm_handler("osrm-fossgis")),
+    ])
+
+
+def parse_failures(values):
+    """Turns ["osrm-project=0.5", ...] into {"osrm-project": 0.5}."""
+    out = {}
+    for value in values or ():
+        name, _, rate = value.partition("=")
+        if name not in UPSTREAMS:
+            raise argparse.ArgumentTypeError(f"unknown upstream {name!r}; expected one of {', '.join(UPSTREAMS)}")
+        out[name] = float(rate)
+    return out
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="mean upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=40.0, help="uniform +/- jitter around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls answered with 503")
+    parser.add_argument("--fail", action="append", metavar="UPSTREAM=RATE",
+                        help=f"per-upstream error rate override ({', '.join(UPSTREAMS)}); repeatable")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, parse_failures(args.fail))
+    uvicorn.run(build_app(faults), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -69,10 +69,22 @@ function renderSingleMessage(m){
   return wrapper;
 }
 
+// seq of the newest message on screen, so a long-poll answer racing a full reload isn't rendered twice
+let lastRenderedSeq = 0;
+// server cursor for /poll; null until the first loadMessages() succeeds
+let chatCursor = null;
+
+function maxSeq(list){
+  let max = 0;
+  for(const m of list) if(typeof m.seq === "number" && m.seq > max) max = m.seq;
+  return max;
+}
+
 function renderMessagesList(list){
   if(!messagesContainer) return;
   messagesContainer.innerHTML = "";
   if(!Array.isArray(list) || list.length === 0){
+    lastRenderedSeq = 0;
     messagesContainer.innerHTML = `<p style="color:#777;margin:8px 12px;">No messages yet.</p>`;
     return;
   }
@@ -80,6 +92,17 @@ function renderMessagesList(list){
     const el = renderSingleMessage(m);
     messagesContainer.appendChild(el);
   }
+  lastRenderedSeq = maxSeq(list);
+  messagesContainer.scrollTop = messagesContainer.scrollHeight;
+}
+
+function appendMessages(list){
+  if(!messagesContainer) return;
+  const fresh = list.filter(m => typeof m.seq !== "number" || m.seq > lastRenderedSeq);
+  if(fresh.length === 0) return;
+  if(!messagesContainer.querySelector(".message-wrapper")) messagesContainer.innerHTML = "";
+  for(const m of fresh) messagesContainer.appendChild(renderSingleMessage(m));
+  lastRenderedSeq = Math.max(lastRenderedSeq, maxSeq(fresh));
   messagesContainer.scrollTop = messagesContainer.scrollHeight;
 }
 
@@ -98,6 +121,7 @@ async function loadMessages(){
     const j = await res.json();
     const msgs = Array.isArray(j.messages) ? j.messages : (Array.isArray(j) ? j : []);
     renderMessagesList(msgs);
+    if(typeof j.cursor === "number") chatCursor = j.cursor;
   } catch (e) {
     console.warn("[chat] loadMessages exception", e);
   }
@@ -118,12 +142,14 @@ async function sendMessage(){
   sendBtn.disabled = true;
 
   const payload = { room_id: room.id, user_id: currentUser.id, content: text };
+  // Same key on the retry below, so a send that did land the first time isn't posted twice
+  const sendKey = (crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random()}`);
 
   try {
     const res = await fetch(`${BACKEND_BASE}/api/chat/send`, {
       method: "POST",
       credentials: "include",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", "Idempotency-Key": sendKey },
       body: JSON.stringify(payload)
     });
 
@@ -143,7 +169,7 @@ async function sendMessage(){
             const retry = await fetch(`${BACKEND_BASE}/api/chat/send`, {
               method: "POST",
               credentials: "include",
-              headers: { "Content-Type": "application/json" },
+              headers: { "Content-Type": "application/json", "Idempotency-Key": sendKey },
               body: JSON.stringify(payload)
             });
             if(retry.ok){
@@ -178,6 +204,37 @@ async function sendMessage(){
   }
 }
 
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+// Long-poll: the server holds the request until a message arrives (or ~25 s pass),
+// so idle rooms cost one open request instead of a fetch every 1.5 s
+async function pollMessages(){
+  let failures = 0;
+  while(room && room.id){
+    if(chatCursor === null){
+      await loadMessages();
+      if(chatCursor === null){ await sleep(1500); continue; }
+    }
+    try {
+      const res = await fetch(`${BACKEND_BASE}/api/chat/${encodeURIComponent(room.id)}/poll?after=${chatCursor}&limit=200`, {
+        method: "GET",
+        credentials: "include"
+      });
+      if(!res.ok) throw new Error(`poll status ${res.status}`);
+      const j = await res.json();
+      const msgs = Array.isArray(j.messages) ? j.messages : [];
+      if(j.reset) renderMessagesList(msgs);
+      else appendMessages(msgs);
+      chatCursor = j.cursor;
+      failures = 0;
+    } catch (e) {
+      failures++;
+      console.warn("[chat] poll failed", e);
+      await sleep(Math.min(1500 * failures, 15000));
+    }
+  }
+}
+
 function wireUI(){
   sendBtn.addEventListener("click", (ev) => { ev.preventDefault(); sendMessage(); });
   input.addEventListener("keydown", (ev) => {
@@ -198,6 +255,5 @@ function wireUI(){
   }
 
   wireUI();
-  loadMessages();
-  setInterval(loadMessages, 1500);
+  pollMessages();
 })();
@@ -384,33 +384,10 @@ function connectRoomsSocket() {
       const data = JSON.parse(ev.data);
       if (!data || !data.type) return;
       console.log("rooms socket message", data);
-      if (data.type === "room:new") {
-        const r = normalizeRoom(data.room || data);
-        // update-or-insert
-        upsertRoom(r.raw || r);
-        saveLocalBackup();
-        renderRooms();
-      } else if (data.type === "room:delete") {
-        const deletedId = String((data.room && (data.room.room_id || data.room.id)) || data.room_id || data.room);
-        rooms = rooms.filter(x => String(x.id) !== deletedId);
-        joinedRooms = joinedRooms.filter(n => String(n) !== deletedId && n !== String(deletedId));
-        dedupeRooms();
-        dedupeJoinedRooms();
-        saveLocalBackup();
-        renderRooms();
-        renderJoinedRooms();
-      } else if (["room:update", "room:join", "room:leave"].includes(data.type)) {
-        const r = normalizeRoom(data.room || data);
-        upsertRoom(r.raw || r);
-        if (data.type === "room:join") {
-          if (!joinedRooms.includes(String(r.id))) joinedRooms.push(String(r.id));
-        } else if (data.type === "room:leave") {
-          joinedRooms = joinedRooms.filter(n => String(n) !== String(r.id));
-        }
-        dedupeJoinedRooms();
-        saveLocalBackup();
-        renderRooms();
-        renderJoinedRooms();
+      if (data.type === "room:batch") {
+        (Array.isArray(data.events) ? data.events : []).forEach(handleRoomEvent);
+      } else {
+        handleRoomEvent(data);
       }
     } catch (err) {
       console.warn("invalid rooms socket message", err);
@@ -423,6 +400,75 @@ function connectRoomsSocket() {
   ws.addEventListener("error", e => console.warn("rooms socket error", e));
 }
 
+function requestRoomSnapshot(roomId) {
+  if (ws && ws.readyState === WebSocket.OPEN) {
+    ws.send(JSON.stringify({ op: "snapshot", room_id: roomId }));
+  }
+}
+
+// Applies a compact {op, room_id, version, ...} delta; a missing room or a
+// version gap means we missed an event, so ask the server for a snapshot.
+function applyRoomDelta(data) {
+  const roomId = String(data.room_id);
+  const room = rooms.find(x => String(x.id) === roomId);
+  const raw = room && room.raw;
+  // Already reflected (e.g. our own join response arrived first)
+  if (raw && typeof raw.version === "number" && data.version <= raw.version) return;
+  if (!raw || typeof raw.version !== "number" || data.version !== raw.version + 1) {
+    requestRoomSnapshot(roomId);
+    return;
+  }
+  const members = Array.isArray(raw.members) ? raw.members.slice() : [];
+  const currentUserId = getCurrentUserId();
+  if (data.op === "member_added") {
+    if (!members.includes(data.user_id)) members.push(data.user_id);
+    if (currentUserId && String(data.user_id) === String(currentUserId) && !joinedRooms.includes(roomId)) joinedRooms.push(roomId);
+  } else if (data.op === "member_removed") {
+    const i = members.indexOf(data.user_id);
+    if (i >= 0) members.splice(i, 1);
+    if (currentUserId && String(data.user_id) === String(currentUserId)) joinedRooms = joinedRooms.filter(n => String(n) !== roomId);
+  }
+  upsertRoom({ ...raw, members, status: data.status || raw.status, creator_name: data.creator_name || raw.creator_name, version: data.version });
+  dedupeJoinedRooms();
+  saveLocalBackup();
+  renderRooms();
+  renderJoinedRooms();
+}
+
+function handleRoomEvent(data) {
+  if (!data || !data.type) return;
+  if (data.type === "room:delta") {
+    applyRoomDelta(data);
+  } else if (data.type === "room:new" || data.type === "room:snapshot") {
+    const r = normalizeRoom(data.room || data);
+    // update-or-insert
+    upsertRoom(r.raw || r);
+    saveLocalBackup();
+    renderRooms();
+  } else if (data.type === "room:delete") {
+    const deletedId = String((data.room && (data.room.room_id || data.room.id)) || data.room_id || data.room);
+    rooms = rooms.filter(x => String(x.id) !== deletedId);
+    joinedRooms = joinedRooms.filter(n => String(n) !== deletedId && n !== String(deletedId));
+    dedupeRooms();
+    dedupeJoinedRooms();
+    saveLocalBackup();
+    renderRooms();
+    renderJoinedRooms();
+  } else if (["room:update", "room:join", "room:leave"].includes(data.type)) {
+    const r = normalizeRoom(data.room || data);
+    upsertRoom(r.raw || r);
+    if (data.type === "room:join") {
+      if (!joinedRooms.includes(String(r.id))) joinedRooms.push(String(r.id));
+    } else if (data.type === "room:leave") {
+      joinedRooms = joinedRooms.filter(n => String(n) !== String(r.id));
+    }
+    dedupeJoinedRooms();
+    saveLocalBackup();
+    renderRooms();
+    renderJoinedRooms();
+  }
+}
+
 function wireUI() {
   $("#btn-create-room")?.addEventListener("click", async () => {
     const name = $("#room-name")?.value?.trim();